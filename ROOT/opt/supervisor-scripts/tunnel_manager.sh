@@ -16,4 +16,10 @@ fi
 
 cd /opt/portal-aio/tunnel_manager
 # Log outside of /var/log/portal
-/opt/portal-aio/venv/bin/fastapi run --host 127.0.0.1 --port 11112 tunnel_manager.py 2>&1 | tee "/var/log/${PROC_NAME}.log"
+if [[ -n $TUNNEL_MANAGER_SOCKET ]]; then
+    # Portal reaches tunnel_manager over a Unix socket instead of TCP
+    rm -f "$TUNNEL_MANAGER_SOCKET"
+    /opt/portal-aio/venv/bin/uvicorn --uds "$TUNNEL_MANAGER_SOCKET" tunnel_manager:app 2>&1 | tee "/var/log/${PROC_NAME}.log"
+else
+    /opt/portal-aio/venv/bin/fastapi run --host 127.0.0.1 --port 11112 tunnel_manager.py 2>&1 | tee "/var/log/${PROC_NAME}.log"
+fi
@@ -0,0 +1,66 @@
+"""
+Time and peak memory of portal.read_last_lines against readlines() on large log files.
+
+Usage: python bench/tail_bench.py [--sizes-mb 1 100 1000] [--lines 500] [--baseline-max-mb 100]
+
+Run from portal-aio with the portal's requirements installed.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+PORTAL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "portal")
+
+def load_read_last_lines():
+    # portal.py resolves its static and template directories relative to the working directory
+    sys.path.insert(0, PORTAL_DIR)
+    os.chdir(PORTAL_DIR)
+    from portal import read_last_lines
+    return read_last_lines
+
+def write_log(path, size_mb, line_length=100):
+    line = b"x" * (line_length - 1) + b"\n"
+    chunk = line * (1024 * 1024 // line_length)
+    with open(path, "wb") as file:
+        for _ in range(size_mb):
+            file.write(chunk)
+
+def readlines_tail(path, max_lines):
+    with open(path, "r", errors="replace") as file:
+        return file.readlines()[-max_lines:]
+
+def measure(function, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--baseline-max-mb", type=int, default=100, help="Largest file to also read with readlines()")
+    args = parser.parse_args()
+
+    read_last_lines = load_read_last_lines()
+    with tempfile.TemporaryDirectory() as directory:
+        for size_mb in args.sizes_mb:
+            path = os.path.join(directory, f"{size_mb}mb.log")
+            write_log(path, size_mb)
+
+            elapsed, peak = measure(read_last_lines, path, args.lines)
+            result = f"{size_mb} MB: read_last_lines {elapsed * 1000:.1f} ms, {peak / 1024:.0f} KiB peak"
+            if size_mb <= args.baseline_max_mb:
+                elapsed, peak = measure(readlines_tail, path, args.lines)
+                result += f"; readlines() {elapsed * 1000:.1f} ms, {peak / 1024 / 1024:.1f} MiB peak"
+            print(result)
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,154 @@
 import os
-import yaml
+import sys
+import json
+import hashlib
 import subprocess
 import time
 import shortuuid
+import requests
+from datetime import datetime, timezone
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+from watchfiles import watch
+
+# portal_config is shared with the portal and tunnel_manager from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import portal_config
 
 CADDY_BIN = "/opt/portal-aio/caddy_manager/caddy"
 CADDY_CONFIG = "/etc/Caddyfile"
 CERT_PATH = "/etc/instance.crt"
 KEY_PATH = "/etc/instance.key"
-MAX_RETRIES = 5
+CERT_WAIT_TIMEOUT = 25  # Seconds to wait for valid certificate material before falling back to HTTP
+CERT_WATCH_TIMEOUT_MS = 500  # How often the cert watch wakes to check the deadline
+PASSWORD_HASH_CACHE = "/var/lib/portal-aio/caddy_manager/password_hash.json"
+GENERATED_PASSWORD_PATH = "/var/lib/portal-aio/caddy_manager/web_password"
+CADDY_ADMIN = os.environ.get('CADDY_ADMIN', 'http://localhost:2019')
+NOAUTH_PATHS = [
+    '/.well-known/acme-challenge/*',
+    '/.well-known/change-password',
+    '/manifest.json',
+    '/manifest.webmanifest',
+    '/site.webmanifest',
+    '/.well-known/security.txt',
+    '/security.txt',
+    '/health.ico'
+]
 
 def load_config():
-    yaml_path = '/etc/portal.yaml'
-    if os.path.exists(yaml_path):
-        with open(yaml_path, 'r') as file:
-            return yaml.safe_load(file)['applications']
+    applications = portal_config.load_applications()
+    if applications is not None:
+        return applications
     
     apps_string = os.environ.get('PORTAL_CONFIG', '')
     if not apps_string:
         raise ValueError("No configuration found in YAML or environment variable")
     
-    apps = {}
-    for app_string in apps_string.split('|'):
-        hostname, ext_port, int_port, path, name = app_string.split(':', 4)
-        
-        apps[name] = {
-            'hostname': hostname,
-            'external_port': int(ext_port),
-            'internal_port': int(int_port),
-            'open_path': str(path),
-            'name': name
-        }
-    
     # Save to file so user can edit before restarting container to pick up changes
-    yaml_data = {"applications": apps}
-    with open(yaml_path, "w") as file:
-        yaml.dump(yaml_data, file, default_flow_style=False, sort_keys=False)
+    portal_config.write_applications(portal_config.parse_portal_config_string(apps_string))
     
-    return apps
+    return portal_config.load_applications()
 
 def validate_cert_and_key():
+    """Return (valid, reason) for the certificate and key pair"""
     try:
-        subprocess.run(["openssl", "x509", "-in", CERT_PATH, "-noout"], check=True, stderr=subprocess.DEVNULL)
-        subprocess.run(["openssl", "rsa", "-in", KEY_PATH, "-check", "-noout"], check=True, stderr=subprocess.DEVNULL)
-        return True
-    except subprocess.CalledProcessError:
-        return False
+        with open(CERT_PATH, 'rb') as file:
+            cert = x509.load_pem_x509_certificate(file.read())
+        with open(KEY_PATH, 'rb') as file:
+            key = serialization.load_pem_private_key(file.read(), password=None)
+    except FileNotFoundError:
+        return False, "certificate or key is missing"
+    except (ValueError, TypeError) as e:
+        return False, f"could not parse certificate or key: {e}"
+
+    public_format = (serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    if cert.public_key().public_bytes(*public_format) != key.public_key().public_bytes(*public_format):
+        return False, "key does not match certificate"
+
+    now = datetime.now(timezone.utc)
+    if now < cert.not_valid_before_utc:
+        return False, f"certificate is not valid until {cert.not_valid_before_utc.isoformat()}"
+    if now > cert.not_valid_after_utc:
+        return False, f"certificate expired on {cert.not_valid_after_utc.isoformat()}"
+    return True, f"certificate expires on {cert.not_valid_after_utc.isoformat()}"
 
 def wait_for_valid_certs():
-    attempts = 0
-    while attempts < MAX_RETRIES:
-        if os.path.exists(CERT_PATH) and os.path.exists(KEY_PATH):
-            if validate_cert_and_key():
-                print("Certificate and key are present and valid.")
-                return True
-            else:
-                print(f"Files are present but invalid, attempt {attempts + 1} of {MAX_RETRIES}.")
-        else:
-            print(f"Waiting for certificate and key to be present, attempt {attempts + 1} of {MAX_RETRIES}.")
-        attempts += 1
-        time.sleep(5)
+    cert_files = {CERT_PATH, KEY_PATH}
+    valid, reason = validate_cert_and_key()
+    if valid:
+        print(f"Certificate and key are present and valid, {reason}.")
+        return True
+
+    deadline = time.monotonic() + CERT_WAIT_TIMEOUT
+    checked = False
+    # The first yield is a timeout, so the watch is already registered when the files are first checked
+    for changes in watch(
+        os.path.dirname(CERT_PATH), os.path.dirname(KEY_PATH),
+        watch_filter=lambda change, path: path in cert_files,
+        recursive=False,
+        rust_timeout=CERT_WATCH_TIMEOUT_MS,
+        yield_on_timeout=True
+    ):
+        if changes or not checked:
+            valid, reason = validate_cert_and_key()
+            if valid:
+                break
+            print(f"{'Certificate and key are not usable yet' if checked else 'Waiting for valid certificate and key'}: {reason}.")
+            checked = True
+        if time.monotonic() >= deadline:
+            break
+
+    if not valid:
+        # One last look in case the files were completed as the time ran out
+        valid, reason = validate_cert_and_key()
+    if valid:
+        print(f"Certificate and key are present and valid, {reason}.")
+        return True
+    print(f"No valid certificate and key after {CERT_WAIT_TIMEOUT}s: {reason}.")
     return False
 
+def get_generated_password():
+    """Random password used when none is configured, kept so regenerating the config doesn't change it"""
+    try:
+        with open(GENERATED_PASSWORD_PATH, 'r') as file:
+            password = file.read().strip()
+        if password:
+            return password
+    except OSError:
+        pass
+
+    password = shortuuid.uuid()
+    try:
+        os.makedirs(os.path.dirname(GENERATED_PASSWORD_PATH), exist_ok=True)
+        fd = os.open(GENERATED_PASSWORD_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            file.write(password)
+    except OSError as e:
+        print(f"Could not save generated password: {e}")
+    return password
+
+def hash_password(password):
+    """bcrypt the password with caddy, reusing the cached hash while the password is unchanged"""
+    # The cache sits next to a Caddyfile that holds the password itself, so a plain digest is enough
+    digest = hashlib.sha256(password.encode()).hexdigest()
+    try:
+        with open(PASSWORD_HASH_CACHE, 'r') as file:
+            cached = json.load(file)
+        if cached.get('digest') == digest and cached.get('hash'):
+            return cached['hash']
+    except (OSError, ValueError):
+        pass
+
+    hashed_password = subprocess.check_output([CADDY_BIN, 'hash-password', '-p', password]).decode().strip()
+    try:
+        os.makedirs(os.path.dirname(PASSWORD_HASH_CACHE), exist_ok=True)
+        fd = os.open(PASSWORD_HASH_CACHE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'digest': digest, 'hash': hashed_password}, file)
+    except OSError as e:
+        print(f"Could not cache password hash: {e}")
+    return hashed_password
+
 def is_port_auth_excluded(external_port):
     # Get the environment variable, default to empty string if not set
     auth_exclude = os.getenv('AUTH_EXCLUDE', '')
@@ -72,35 +159,26 @@ def is_port_auth_excluded(external_port):
     # Check if the external port is not in the excluded list
     return external_port in excluded_ports
 
-def generate_caddyfile(config):
+def get_https_enabled():
     if os.environ.get('ENABLE_HTTPS', 'false').lower() != 'true' and wait_for_valid_certs():
-        enable_https = False
-    else:
-        enable_https = True
+        return False
+    return True
+
+def generate_caddyfile(config, enable_https=None):
+    if enable_https is None:
+        enable_https = get_https_enabled()
 
     enable_auth = True if os.environ.get('ENABLE_AUTH', 'true').lower() != 'false' else False
     web_username = os.environ.get('WEB_USERNAME', 'vastai')
-    web_password = web_password = os.environ.get('WEB_PASSWORD') or os.environ.get('OPEN_BUTTON_TOKEN') or shortuuid.uuid()
+    web_password = os.environ.get('WEB_PASSWORD') or os.environ.get('OPEN_BUTTON_TOKEN') or get_generated_password()
     caddy_identifier = os.environ.get('VAST_CONTAINERLABEL')
+    hashed_password = None
 
     caddyfile = "{\n"
     if enable_https:
         caddyfile += '    servers { listener_wrappers { http_redirect\ntls } }\n'
     caddyfile += "}\n\n"
 
-    caddyfile += '    (noauth) {\n'
-    caddyfile += '        @noauth {\n'
-    caddyfile += '            path /.well-known/acme-challenge/*\n'
-    caddyfile += '            path /.well-known/change-password\n'
-    caddyfile += '            path /manifest.json\n'
-    caddyfile += '            path /manifest.webmanifest\n'
-    caddyfile += '            path /site.webmanifest\n'
-    caddyfile += '            path /.well-known/security.txt\n'
-    caddyfile += '            path /security.txt\n'
-    caddyfile += '            path /health.ico\n'
-    caddyfile += '        }\n'
-    caddyfile += '    }\n\n'
-
     # Add a simple icon we can load in javascript to ensure tunnel DNS resolution
     caddyfile += '    (healthicon) {\n'
     caddyfile += '            route /health.ico {\n'
@@ -114,29 +192,37 @@ def generate_caddyfile(config):
     caddyfile += '            }\n'
     caddyfile += '        }\n\n'
 
-    for app_name, app_config in config.items():
-        external_port = app_config['external_port']
-        internal_port = app_config['internal_port']
-        hostname = app_config['hostname']
+    for app_name, application in config.items():
+        external_port = application.external_port
+        internal_port = application.internal_port
+        hostname = application.hostname
 
         # If the internal and external are the same or user has not exposed port, we cannot proxy (but we still need the config for Portal - For Jupyter)
         if external_port == internal_port or not os.environ.get(f"VAST_TCP_PORT_{external_port}"):
             continue
 
+        # One named upstream per app, so every auth route shares a single proxy handler and health checker
+        upstream = f"upstream_{external_port}"
+        caddyfile += generate_upstream_snippet(upstream, hostname, internal_port, application.proxy)
+
         caddyfile += f":{external_port} {{\n"
         if enable_https:
             caddyfile += f'    tls {CERT_PATH} {KEY_PATH}\n'
         
         caddyfile += '    root * /opt/portal-aio/caddy_manager/public\n\n'
-        caddyfile += '    handle_errors 502 {\n'
+        # 503 is what Caddy returns while an active health check has the upstream marked down
+        caddyfile += '    handle_errors 502 503 {\n'
         caddyfile += '        rewrite * /502.html\n'
         caddyfile += '        file_server\n'
         caddyfile += '    }\n\n'
 
         if enable_auth and not is_port_auth_excluded(external_port):
-            caddyfile += generate_auth_config(caddy_identifier, web_username, web_password, hostname, internal_port)
+            # Every app shares the credentials, so bcrypt runs at most once
+            if hashed_password is None:
+                hashed_password = hash_password(web_password)
+            caddyfile += generate_auth_config(caddy_identifier, web_username, web_password, hashed_password, upstream)
         else:
-            caddyfile += generate_noauth_config(hostname, internal_port)
+            caddyfile += generate_noauth_config(upstream)
                                                                
         caddyfile += "}\n\n"
 
@@ -146,87 +232,163 @@ def generate_caddyfile(config):
 def get_reverse_proxy_block(hostname, internal_port):
     include_header_up_host = os.environ.get('CADDY_HEADER_UP_LOCALHOST', '').lower() == 'true'
     if include_header_up_host:
-        return f'''
-        header_up Host {hostname}:{internal_port}
+        return f'''        header_up Host {hostname}:{internal_port}
         header_up X-Real-IP {{remote_host}}
-    '''
-    return f'''
-        header_up Host {{upstream_hostport}}
+'''
+    return f'''        header_up Host {{upstream_hostport}}
         header_up X-Real-IP {{remote_host}}
 '''
 
-def generate_noauth_config(hostname, internal_port):
+def generate_upstream_snippet(upstream, hostname, internal_port, proxy):
+    settings = proxy.to_config()
+    transport = [f'            {key} {settings.pop(key)}\n' for key in ('keepalive', 'keepalive_idle_conns') if key in settings]
+
+    snippet = f'({upstream}) {{\n'
+    snippet += f'    reverse_proxy {hostname}:{internal_port} {{\n'
+    snippet += get_reverse_proxy_block(hostname, internal_port)
+    for key, value in settings.items():
+        snippet += f'        {key} {value}\n'
+    if transport:
+        snippet += '        transport http {\n'
+        snippet += ''.join(transport)
+        snippet += '        }\n'
+    snippet += '    }\n'
+    snippet += '}\n\n'
+    return snippet
+
+def generate_noauth_config(upstream):
     no_auth_config = f'''
-    reverse_proxy {hostname}:{internal_port} {{
-        {get_reverse_proxy_block(hostname, internal_port)}
-    }}
+    import {upstream}
 '''
     return no_auth_config
 
-def generate_auth_config(caddy_identifier, username, password, hostname, internal_port):
-    hashed_password = subprocess.check_output([CADDY_BIN, 'hash-password', '-p', password]).decode().strip()
-   
-    auth_config = f'''    
-    import noauth
-
+def generate_auth_config(caddy_identifier, username, password, hashed_password, upstream):
+    noauth_paths = ' '.join(NOAUTH_PATHS)
+    auth_config = f'''
     @token_auth {{
         query token={password}
     }}
 
-    handle @noauth {{
-        import healthicon
-        reverse_proxy {hostname}:{internal_port} {{
-            {get_reverse_proxy_block(hostname, internal_port)}        
-        }}
-    }}
-
-    @has_valid_auth_cookie {{
-        header_regexp Cookie {caddy_identifier}_auth_token={password}
+    @needs_basic_auth {{
+        not path {noauth_paths}
+        not header_regexp Cookie {caddy_identifier}_auth_token={password}
+        not header Authorization "Bearer {password}"
     }}
 
-    @has_valid_bearer_token {{
-        header Authorization "Bearer {password}"
-    }}
-
-    route @token_auth {{
-        header Set-Cookie "{caddy_identifier}_auth_token={password}; Path=/; Max-Age=604800; HttpOnly; SameSite=lax"
-        uri query -token
-        redir * {{uri}} 302
-    }}
-
-    route @has_valid_auth_cookie {{
-        reverse_proxy {hostname}:{internal_port} {{
-            {get_reverse_proxy_block(hostname, internal_port)}        
-        }}
-    }}
+    route {{
+        import healthicon
 
-    route @has_valid_bearer_token {{
-        reverse_proxy {hostname}:{internal_port} {{
-            {get_reverse_proxy_block(hostname, internal_port)}
+        route @token_auth {{
+            header Set-Cookie "{caddy_identifier}_auth_token={password}; Path=/; Max-Age=604800; HttpOnly; SameSite=lax"
+            uri query -token
+            redir * {{uri}} 302
         }}
-    }}
 
-    route {{
-        basic_auth {{
+        basic_auth @needs_basic_auth {{
             {username} "{hashed_password}"
         }}
-        header Set-Cookie "{caddy_identifier}_auth_token={password}; Path=/; Max-Age=604800; HttpOnly; SameSite=lax"
-        reverse_proxy {hostname}:{internal_port} {{
-            {get_reverse_proxy_block(hostname, internal_port)}
-        }}
+        header @needs_basic_auth Set-Cookie "{caddy_identifier}_auth_token={password}; Path=/; Max-Age=604800; HttpOnly; SameSite=lax"
+
+        import {upstream}
     }}
 '''
     return auth_config
 
+def write_caddyfile(caddyfile_content):
+    with open(CADDY_CONFIG, 'w') as f:
+        f.write(caddyfile_content)
+    
+    subprocess.run([CADDY_BIN, 'fmt', '--overwrite', CADDY_CONFIG])
+
+def adapt_caddyfile(caddyfile_content):
+    """Convert a Caddyfile to JSON config with the running Caddy, naming each server after its port"""
+    response = requests.post(f"{CADDY_ADMIN}/adapt", data=caddyfile_content, headers={'Content-Type': 'text/caddyfile'}, timeout=10)
+    response.raise_for_status()
+    config = response.json()['result']
+
+    # The adapter numbers servers (srv0, srv1...) so adding an app would rename the rest
+    servers = config.get('apps', {}).get('http', {}).get('servers', {})
+    if servers:
+        config['apps']['http']['servers'] = {
+            'port_' + '_'.join(listen.rsplit(':', 1)[-1] for listen in server.get('listen', [])): server
+            for server in servers.values()
+        }
+    return config
+
+def apply_config(config):
+    """Push config to Caddy, touching only the servers that changed when possible"""
+    response = requests.get(f"{CADDY_ADMIN}/config/", timeout=10)
+    response.raise_for_status()
+    current = response.json() or {}
+
+    def without_servers(value):
+        value = json.loads(json.dumps(value))
+        value.get('apps', {}).get('http', {}).pop('servers', None)
+        return value
+
+    current_servers = current.get('apps', {}).get('http', {}).get('servers', {})
+    servers = config.get('apps', {}).get('http', {}).get('servers', {})
+    if without_servers(current) != without_servers(config) or not all(name.startswith('port_') for name in current_servers):
+        # Global options or server naming differ; a full load is still a graceful reload
+        requests.post(f"{CADDY_ADMIN}/load", json=config, timeout=30).raise_for_status()
+        return "reloaded"
+
+    changes = []
+    for name in current_servers.keys() - servers.keys():
+        requests.delete(f"{CADDY_ADMIN}/config/apps/http/servers/{name}", timeout=30).raise_for_status()
+        changes.append(f"-{name}")
+    for name, server in servers.items():
+        if current_servers.get(name) != server:
+            requests.post(f"{CADDY_ADMIN}/config/apps/http/servers/{name}", json=server, timeout=30).raise_for_status()
+            changes.append(f"{'~' if name in current_servers else '+'}{name}")
+    return ', '.join(changes) or "unchanged"
+
+def wait_for_caddy_admin(timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{CADDY_ADMIN}/config/", timeout=2)
+            return True
+        except requests.RequestException:
+            time.sleep(0.5)
+    return False
+
+def sync_caddy(applications, enable_https=None):
+    caddyfile_content, _, _ = generate_caddyfile(applications, enable_https)
+    result = apply_config(adapt_caddyfile(caddyfile_content))
+    # Keep the file in step so a restarted Caddy comes up with the same config
+    write_caddyfile(caddyfile_content)
+    print(f"Caddy configuration applied: {result}")
+
+def watch_config():
+    """Apply edits to portal.yaml through Caddy's admin API as they happen"""
+    if not wait_for_caddy_admin():
+        print(f"Caddy admin API at {CADDY_ADMIN} is not reachable, not watching {portal_config.PORTAL_CONFIG_PATH}")
+        return
+
+    # Settled once here so a config push never waits on certificates
+    enable_https = get_https_enabled()
+    portal_config.subscribe(lambda applications: sync_caddy_safely(applications, enable_https))
+    # The first parse notifies too, catching any edit made before the admin API was available
+    try:
+        load_config()
+    except Exception as e:
+        print(f"Error loading configuration: {e}")
+    portal_config.watch_applications_blocking()
+
+def sync_caddy_safely(applications, enable_https=None):
+    try:
+        sync_caddy(applications, enable_https)
+    except Exception as e:
+        # The running config stays in place
+        print(f"Error applying Caddy configuration: {e}")
+
 def main():
     try:
         config = load_config()
         caddyfile_content, username, password = generate_caddyfile(config)
         
-        with open('/etc/Caddyfile', 'w') as f:
-            f.write(caddyfile_content)
-        
-        subprocess.run([CADDY_BIN, 'fmt', '--overwrite', CADDY_CONFIG])
+        write_caddyfile(caddyfile_content)
         
         print("*****")
         print("*")
@@ -244,4 +406,7 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if '--watch' in sys.argv[1:]:
+        watch_config()
+    else:
+        main()
\ No newline at end of file
@@ -35,9 +35,18 @@ instance_portal() {
     /opt/portal-aio/venv/bin/python caddy_config_manager.py 2>&1 | tee -a /var/log/portal/caddy.log
     /opt/portal-aio/caddy_manager/caddy run --config /etc/Caddyfile 2>&1 | tee -a /var/log/portal/caddy.log &
     PIDS+=($!)
+    # Apply portal.yaml edits to the running Caddy without a restart
+    /opt/portal-aio/venv/bin/python caddy_config_manager.py --watch 2>&1 | tee -a /var/log/portal/caddy.log &
+    PIDS+=($!)
 
     cd /opt/portal-aio/tunnel_manager || exit 1
-    /opt/portal-aio/venv/bin/fastapi run --host 127.0.0.1 --port 11112 tunnel_manager.py 2>&1 | tee -a /var/log/portal/tunnel-manager.log &
+    if [[ -n $TUNNEL_MANAGER_SOCKET ]]; then
+        # Portal reaches tunnel_manager over a Unix socket instead of TCP
+        rm -f "$TUNNEL_MANAGER_SOCKET"
+        /opt/portal-aio/venv/bin/uvicorn --uds "$TUNNEL_MANAGER_SOCKET" tunnel_manager:app 2>&1 | tee -a /var/log/portal/tunnel-manager.log &
+    else
+        /opt/portal-aio/venv/bin/fastapi run --host 127.0.0.1 --port 11112 tunnel_manager.py 2>&1 | tee -a /var/log/portal/tunnel-manager.log &
+    fi
     PIDS+=($!)
 
     cd /opt/portal-aio/portal || exit 1
@@ -1,10 +1,10 @@
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, StreamingResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from typing import Optional, List
 from collections import deque
-import yaml
+from types import MappingProxyType
 import json
 import httpx
 import asyncio
@@ -12,14 +12,32 @@ import aiofiles
 import os
 import io
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import hashlib
 from datetime import datetime
 import logging
 import time
+import math
 import ipaddress
 import subprocess
+import shutil
+import glob
+import re
+import sys
 import GPUtil
 import psutil
 import numpy as np
+from watchfiles import awatch, Change
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+# portal_config is shared with tunnel_manager and caddy_manager from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import portal_config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -27,43 +45,29 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger("log_monitor")
 
 tunnel_manager=os.environ.get("TUNNEL_MANAGER", "http://localhost:11112")
+tunnel_manager_socket=os.environ.get("TUNNEL_MANAGER_SOCKET")  # Optional Unix socket used instead of TCP
 
 app = FastAPI()
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-def get_scheme():
-    if os.environ.get("ENABLE_HTTPS", "false").lower() != "true":
-        scheme = "http"
-    else:
-        scheme = "https"
-    return scheme
+config_cache = {"applications": None}  # Serialized applications, rebuilt when portal_config reports a change
 
-def load_config():
-    yaml_path = '/etc/portal.yaml'
-    
+async def load_config():
+    """Return the read-only application map"""
     # Wait until the file exists - caddy-manager handles config writing
-    while not os.path.exists(yaml_path):
-        print(f"Waiting for {yaml_path} to appear...")
-        time.sleep(1)
-
-    with open(yaml_path, 'r') as file:
-        config_applications = yaml.safe_load(file)['applications']
-        return hydrate_applications(config_applications)
-
-def hydrate_applications(applications):
-    for app_name, app in applications.items():
-        hostname = app["hostname"]
-        external_port = app["external_port"]
-        internal_port = app["internal_port"]
-        if external_port == internal_port and internal_port == 8080:
-            scheme = "https"
-        else:
-            scheme = get_scheme()
-        applications[app_name]["target_url"] = f'{scheme}://{hostname}:{external_port}'
-        applications[app_name]["mapped_port"] = os.environ.get(f'VAST_TCP_PORT_{external_port}', "")
-    return applications
+    await portal_config.wait_for_applications()
+    return config_cache["applications"]
+
+def freeze_applications(applications):
+    # Shared between requests, so callers must copy before modifying
+    return MappingProxyType({app_name: MappingProxyType(app.to_dict()) for app_name, app in applications.items()})
+
+def on_config_change(applications):
+    config_cache["applications"] = freeze_applications(applications)
+
+portal_config.subscribe(on_config_change)
 
 def strip_port(host):
     return host.split(':')[0]
@@ -76,30 +80,18 @@ def get_instance_properties():
     }
 
 def get_gpu_info():
-    """Get formatted GPU information for both NVIDIA and AMD GPUs"""
+    """Get formatted GPU information for both NVIDIA and AMD GPUs from the sampled metrics"""
+    # The providers are only touched by the sampler thread, never from a request
+    if metrics_snapshot is None:
+        return "GPU information unavailable"
+
     gpu_models = {}
-    
-    # Try to get NVIDIA GPUs
-    try:
-        nvidia_gpus = GPUtil.getGPUs()
-        for gpu in nvidia_gpus:
-            if gpu.name in gpu_models:
-                gpu_models[gpu.name] += 1
-            else:
-                gpu_models[gpu.name] = 1
-    except Exception:
-        pass
-    
-    # Try to get AMD GPUs
-    try:
-        rocm_gpus = get_rocm_gpus()
-        for gpu in rocm_gpus:
-            if gpu.name in gpu_models:
-                gpu_models[gpu.name] += 1
-            else:
-                gpu_models[gpu.name] = 1
-    except Exception:
-        pass
+    for device in metrics_snapshot['gpu'].get('devices', []):
+        name = device['name']
+        if name in gpu_models:
+            gpu_models[name] += 1
+        else:
+            gpu_models[name] = 1
     
     # Check if any GPUs are available
     if not gpu_models:
@@ -115,94 +107,315 @@ def get_gpu_info():
     
     return ", ".join(result)
 
-def get_rocm_gpus():
-    """Get AMD GPU information using rocm-smi command line tool"""
+## GPU metrics providers
+GPU_PROVIDER = os.environ.get("PORTAL_GPU_PROVIDER", "auto").lower()  # auto (NVML with GPUtil fallback), nvml, gputil or fake
+
+class GPUInfo:
+    """Per-GPU sample with the same attributes as GPUtil.GPU plus power readings"""
+    def __init__(self, id, name, load, memoryUsed, memoryTotal, temperature=None, powerDraw=None, powerLimit=None):
+        self.id = id
+        self.name = name
+        self.load = load  # 0.0 - 1.0
+        self.memoryUsed = memoryUsed  # MB
+        self.memoryTotal = memoryTotal  # MB
+        self.temperature = temperature  # Celsius
+        self.powerDraw = powerDraw  # Watts
+        self.powerLimit = powerLimit  # Watts
+
+class NVMLProvider:
+    """Reads NVIDIA GPU metrics through a long-lived NVML session"""
+    name = "nvml"
+
+    def __init__(self):
+        if pynvml is None:
+            raise RuntimeError("nvidia-ml-py is not installed")
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        # Static properties are read once for the lifetime of the session
+        self.names = [self._decode(pynvml.nvmlDeviceGetName(handle)) for handle in self.handles]
+        self.power_limits = [self._optional(pynvml.nvmlDeviceGetPowerManagementLimit, handle) for handle in self.handles]
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    @staticmethod
+    def _optional(func, *args):
+        # Not every board supports every query (e.g. power on some consumer cards)
+        try:
+            return func(*args)
+        except pynvml.NVMLError:
+            return None
+
+    def get_gpus(self):
+        gpus = []
+        for index, handle in enumerate(self.handles):
+            utilization = pynvml.nvmlDeviceGetUtilizationRates(handle)
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            temperature = self._optional(pynvml.nvmlDeviceGetTemperature, handle, pynvml.NVML_TEMPERATURE_GPU)
+            power_draw = self._optional(pynvml.nvmlDeviceGetPowerUsage, handle)
+            power_limit = self.power_limits[index]
+            gpus.append(GPUInfo(
+                id=index,
+                name=self.names[index],
+                load=utilization.gpu / 100.0,
+                memoryUsed=memory.used / (1024 * 1024),
+                memoryTotal=memory.total / (1024 * 1024),
+                temperature=temperature,
+                powerDraw=power_draw / 1000.0 if power_draw is not None else None,
+                powerLimit=power_limit / 1000.0 if power_limit is not None else None
+            ))
+        return gpus
+
+    def close(self):
+        pynvml.nvmlShutdown()
+
+class GPUtilProvider:
+    """Fallback that parses nvidia-smi output on every call"""
+    name = "gputil"
+
+    def get_gpus(self):
+        return GPUtil.getGPUs()
+
+    def close(self):
+        pass
+
+class FakeGPUProvider:
+    """Returns fixed GPU readings for tests and development without GPUs"""
+    name = "fake"
+
+    def __init__(self, gpus=None):
+        if gpus is None:
+            count = int(os.environ.get("PORTAL_FAKE_GPU_COUNT", "1"))
+            gpus = [GPUInfo(id=i, name="Fake GPU", load=0.5, memoryUsed=8192.0, memoryTotal=24576.0,
+                            temperature=60, powerDraw=200.0, powerLimit=350.0) for i in range(count)]
+        self.gpus = gpus
+
+    def get_gpus(self):
+        return list(self.gpus)
+
+    def close(self):
+        pass
+
+DRM_PATH = "/sys/class/drm"
+AMD_VENDOR_ID = "0x1002"
+
+gpu_provider = None  # Created once by init_gpu_providers on the metrics sampler thread
+
+def create_gpu_provider():
+    if GPU_PROVIDER == "fake":
+        return FakeGPUProvider()
+    if GPU_PROVIDER == "gputil":
+        return GPUtilProvider()
     try:
-        # Check if rocm-smi is available
-        rocm_available = subprocess.run(
-            ['which', 'rocm-smi'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
-        ).returncode == 0
-        
-        if not rocm_available:
-            return []
-        
-        # First get GPU info with memory and usage
+        return NVMLProvider()
+    except Exception as e:
+        if GPU_PROVIDER == "nvml":
+            # Chosen explicitly, so surface the problem rather than hiding it behind GPUtil
+            raise RuntimeError(f"PORTAL_GPU_PROVIDER=nvml but NVML is unavailable: {e}")
+        logger.info(f"NVML unavailable, falling back to GPUtil: {e}")
+        return GPUtilProvider()
+
+def get_gpu_provider():
+    global gpu_provider
+    if gpu_provider is None:
+        gpu_provider = create_gpu_provider()
+        logger.info(f"Using {gpu_provider.name} GPU metrics provider")
+    return gpu_provider
+
+def init_gpu_providers():
+    """Detect NVIDIA and AMD GPUs up front; blocking, so called from a worker thread"""
+    if GPU_PROVIDER != "fake":
+        get_rocm_provider()
+    get_gpu_provider()
+
+def close_gpu_provider():
+    global gpu_provider
+    if gpu_provider is not None:
+        gpu_provider.close()
+        gpu_provider = None
+
+class ROCmProvider:
+    """Reads AMD GPU metrics from sysfs, falling back to rocm-smi when sysfs is missing"""
+    name = "rocm"
+
+    def __init__(self):
+        # Availability and product names are detected once for the process lifetime
+        self.rocm_smi = shutil.which('rocm-smi')
+        self.cards = self._find_sysfs_cards()
+        self.names = self._get_product_names()
+
+    @staticmethod
+    def _find_sysfs_cards():
+        cards = []
+        if not os.path.isdir(DRM_PATH):
+            return cards
+
+        # cardN entries only; connectors such as card0-DP-1 are skipped
+        card_ids = sorted(int(entry[4:]) for entry in os.listdir(DRM_PATH) if re.fullmatch(r'card\d+', entry))
+        for card_id in card_ids:
+            device_path = os.path.join(DRM_PATH, f'card{card_id}', 'device')
+            if read_sysfs(os.path.join(device_path, 'vendor')) != AMD_VENDOR_ID:
+                continue
+            if not os.path.exists(os.path.join(device_path, 'mem_info_vram_total')):
+                continue
+            hwmon = glob.glob(os.path.join(device_path, 'hwmon', 'hwmon*'))
+            cards.append((card_id, device_path, hwmon[0] if hwmon else None))
+        return cards
+
+    def _get_product_names(self):
+        names = {}
+        if self.rocm_smi:
+            result = subprocess.run(
+                [self.rocm_smi, '--showproductname', '--json'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if result.returncode == 0:
+                names = parse_rocm_product_names(result.stdout)
+
+        # rocm-smi numbers devices itself, so match sysfs cards by position
+        smi_names = list(names.values())
+        for position, (card_id, device_path, _) in enumerate(self.cards):
+            name = read_sysfs(os.path.join(device_path, 'product_name'))
+            if name:
+                names[f'card{card_id}'] = name
+            elif position < len(smi_names):
+                names[f'card{card_id}'] = smi_names[position]
+        return names
+
+    def available(self):
+        return bool(self.cards or self.rocm_smi)
+
+    def get_gpus(self):
+        if self.cards:
+            return self._get_sysfs_gpus()
+        if self.rocm_smi:
+            return self._get_rocm_smi_gpus()
+        return []
+
+    def _get_sysfs_gpus(self):
+        gpus = []
+        for card_id, device_path, hwmon_path in self.cards:
+            memory_total = int(read_sysfs(os.path.join(device_path, 'mem_info_vram_total')) or 0)
+            memory_used = int(read_sysfs(os.path.join(device_path, 'mem_info_vram_used')) or 0)
+            busy = read_sysfs(os.path.join(device_path, 'gpu_busy_percent'))
+            temperature = read_sysfs(os.path.join(hwmon_path, 'temp1_input')) if hwmon_path else None
+            power = read_sysfs(os.path.join(hwmon_path, 'power1_average')) if hwmon_path else None
+            power_cap = read_sysfs(os.path.join(hwmon_path, 'power1_cap')) if hwmon_path else None
+
+            gpu = GPUInfo(
+                id=card_id,
+                name=self.names.get(f'card{card_id}', 'AMD GPU'),
+                load=float(busy) / 100.0 if busy else 0,
+                memoryUsed=round(memory_used / (1024 * 1024), 2),
+                memoryTotal=round(memory_total / (1024 * 1024), 2),
+                temperature=int(temperature) / 1000 if temperature else None,  # millidegrees
+                powerDraw=int(power) / 1000000 if power else None,  # microwatts
+                powerLimit=int(power_cap) / 1000000 if power_cap else None
+            )
+            gpu.memoryUsed_mb = gpu.memoryUsed
+            gpu.memoryTotal_mb = gpu.memoryTotal
+            gpus.append(gpu)
+        return gpus
+
+    def _get_rocm_smi_gpus(self):
         result = subprocess.run(
-            ['rocm-smi', '--showmeminfo', 'vram', '--showuse', '--json'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
+            [self.rocm_smi, '--showmeminfo', 'vram', '--showuse', '--json'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True
         )
-        
+
         if result.returncode != 0:
             return []
-        
+
         # Parse JSON output for memory and usage
         rocm_data = json.loads(result.stdout)
-        
-        # Get additional GPU info including name
-        name_result = subprocess.run(
-            ['rocm-smi', '--showproductname', '--json'], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, 
-            text=True
-        )
-        
-        # Parse GPU name data if available
-        gpu_names = {}
-        if name_result.returncode == 0:
-            try:
-                name_data = json.loads(name_result.stdout)
-                for card_id, card_data in name_data.items():
-                    if isinstance(card_data, dict):
-                        # Try to construct a meaningful name from available fields
-                        vendor = card_data.get('Card Vendor', '').split('[')[-1].split(']')[0] if '[' in card_data.get('Card Vendor', '') else card_data.get('Card Vendor', '')
-                        sku = card_data.get('Card SKU', '')
-                        gfx = card_data.get('GFX Version', '')
-                        
-                        if vendor and sku:
-                            gpu_names[card_id] = f"{vendor} {sku} ({gfx})"
-                        elif vendor:
-                            gpu_names[card_id] = f"{vendor} GPU"
-                        else:
-                            gpu_names[card_id] = "AMD GPU"
-            except:
-                pass
-        
+
         gpus = []
-        
+
         for card_id, card_data in rocm_data.items():
             if not isinstance(card_data, dict):
                 continue
-                
-            # Create a GPU object similar to GPUtil's structure
-            gpu = type('', (), {})()
-            gpu.id = int(card_id.replace('card', ''))
-            
-            # Set GPU name from the name data if available, otherwise use a default
-            gpu.name = gpu_names.get(card_id, 'AMD GPU')
-            
+
             # Extract memory info based on the actual output format
-            gpu.memoryTotal = int(card_data.get('VRAM Total Memory (B)', 0))
-            gpu.memoryTotal_mb = round(gpu.memoryTotal / (1024 * 1024), 2)  # Convert to MB
-            
-            gpu.memoryUsed = int(card_data.get('VRAM Total Used Memory (B)', 0))
-            gpu.memoryUsed_mb = round(gpu.memoryUsed / (1024 * 1024), 2)  # Convert to MB
-            
+            memory_total = int(card_data.get('VRAM Total Memory (B)', 0))
+            memory_used = int(card_data.get('VRAM Total Used Memory (B)', 0))
+
             # Extract GPU utilization
             gpu_busy = card_data.get('GPU use (%)', 0)
             try:
-                gpu.load = float(gpu_busy) / 100.0 if isinstance(gpu_busy, (int, float, str)) else 0
+                load = float(gpu_busy) / 100.0 if isinstance(gpu_busy, (int, float, str)) else 0
             except (ValueError, TypeError):
-                gpu.load = 0
-                
+                load = 0
+
+            gpu = GPUInfo(
+                id=int(card_id.replace('card', '')),
+                # Set GPU name from the cached name data if available, otherwise use a default
+                name=self.names.get(card_id, 'AMD GPU'),
+                load=load,
+                memoryUsed=round(memory_used / (1024 * 1024), 2),
+                memoryTotal=round(memory_total / (1024 * 1024), 2)
+            )
+            gpu.memoryUsed_mb = gpu.memoryUsed
+            gpu.memoryTotal_mb = gpu.memoryTotal
             gpus.append(gpu)
-            
+
         return gpus
+
+    def close(self):
+        pass
+
+def read_sysfs(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def parse_rocm_product_names(output):
+    """Build card id -> display name from rocm-smi --showproductname --json output"""
+    gpu_names = {}
+    try:
+        name_data = json.loads(output)
+        for card_id, card_data in name_data.items():
+            if isinstance(card_data, dict):
+                # Try to construct a meaningful name from available fields
+                vendor = card_data.get('Card Vendor', '').split('[')[-1].split(']')[0] if '[' in card_data.get('Card Vendor', '') else card_data.get('Card Vendor', '')
+                sku = card_data.get('Card SKU', '')
+                gfx = card_data.get('GFX Version', '')
+                
+                if vendor and sku:
+                    gpu_names[card_id] = f"{vendor} {sku} ({gfx})"
+                elif vendor:
+                    gpu_names[card_id] = f"{vendor} GPU"
+                else:
+                    gpu_names[card_id] = "AMD GPU"
+    except:
+        pass
+    return gpu_names
+
+rocm_provider = None  # Detected once; rocm-smi is never probed again on machines without it
+
+def get_rocm_provider():
+    global rocm_provider
+    if rocm_provider is None:
+        rocm_provider = ROCmProvider()
+        if rocm_provider.available():
+            source = "sysfs" if rocm_provider.cards else "rocm-smi"
+            logger.info(f"Reading AMD GPU metrics from {source}")
+    return rocm_provider
+
+def get_rocm_gpus():
+    """Get AMD GPU information from sysfs or the rocm-smi command line tool"""
+    if GPU_PROVIDER == "fake":
+        return []
+    try:
+        return get_rocm_provider().get_gpus()
     except Exception as e:
-        print(f"Error getting ROCm GPU info: {str(e)}")
+        logger.error(f"Error getting ROCm GPU info: {str(e)}")
         return []
     
 def is_in_container():
@@ -268,6 +481,52 @@ templates.env.filters["strip_port"] = strip_port
 
 tunnels = {}
 tunnel_api_timeout=httpx.Timeout(connect=5.0, read=30.0, write=5.0, pool=5.0)
+tunnel_api_limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+
+tunnel_client: Optional[httpx.AsyncClient] = None  # Shared keep-alive client for the application lifetime
+upstream_latency = {}  # tunnel_manager route -> request count, errors and timings
+
+def get_tunnel_client():
+    global tunnel_client
+    if tunnel_client is None:
+        transport = httpx.AsyncHTTPTransport(uds=tunnel_manager_socket, limits=tunnel_api_limits) if tunnel_manager_socket else None
+        tunnel_client = httpx.AsyncClient(timeout=tunnel_api_timeout, limits=tunnel_api_limits, transport=transport)
+    return tunnel_client
+
+async def close_tunnel_client():
+    global tunnel_client
+    if tunnel_client is not None:
+        await tunnel_client.aclose()
+        tunnel_client = None
+
+async def tunnel_request(method, url):
+    """Send a request to tunnel_manager over the shared client and record its latency"""
+    # Group by the first path segment so per-target URLs share one entry
+    route = "/" + httpx.URL(url).path.lstrip("/").split("/")[0]
+    stats = upstream_latency.setdefault(route, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0})
+
+    start = time.perf_counter()
+    try:
+        response = await get_tunnel_client().request(method, url)
+        if response.status_code >= 500:
+            stats["errors"] += 1
+        return response
+    except httpx.HTTPError:
+        stats["errors"] += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stats["count"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        stats["last_seconds"] = elapsed
+
+@app.get("/upstream-metrics")
+async def get_upstream_metrics():
+    return {
+        route: {**stats, "avg_seconds": stats["total_seconds"] / stats["count"] if stats["count"] else 0}
+        for route, stats in upstream_latency.items()
+    }
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, token: Optional[str] = None):
@@ -275,6 +534,11 @@ async def read_root(request: Request, token: Optional[str] = None):
         return RedirectResponse(url="/", status_code=302)
 
     await set_external_ip(request.headers.get("X-Forwarded-Host"))
+    # The GPU line comes from the first metrics sample
+    try:
+        await asyncio.wait_for(metrics_ready.wait(), timeout=METRICS_INTERVAL + 10)
+    except asyncio.TimeoutError:
+        pass
     return templates.TemplateResponse("index.html", {
         "request": request,
         "instance": get_instance_properties(),
@@ -282,144 +546,206 @@ async def read_root(request: Request, token: Optional[str] = None):
 
 @app.get("/get-applications")
 async def get_applications(request: Request):
-    applications = load_config()
+    return JSONResponse(await get_applications_for_request(request))
+
+async def get_applications_for_request(request: Request):
     auth_token = request.cookies.get(f"" + os.environ.get('VAST_CONTAINERLABEL') + "_auth_token")
-    for app_name, app in applications.items():
+
+    # Inject the token into a per-request copy of the cached applications
+    applications = {}
+    for app_name, app in (await load_config()).items():
+        app = dict(app)
         separator = '&' if '?' in app["open_path"] else '?'
         app["open_path"] += f"{separator}token={auth_token}"
+        applications[app_name] = app
+
+    return applications
+
+@app.get("/dashboard-state")
+async def get_dashboard_state(request: Request, include_metrics: bool = True):
+    """
+    Everything the dashboard needs on load in one document.
+
+    Parameters:
+    - include_metrics: Set false when metrics arrive over /ws-metrics so the ETag stays stable
+    """
+    applications = await get_applications_for_request(request)
+
+    async def fetch_tunnel_state():
+        response = await tunnel_request("GET", f"{tunnel_manager}/dashboard-state")
+        response.raise_for_status()
+        return response.json()
+
+    async def wait_for_metrics():
+        if include_metrics:
+            await asyncio.wait_for(metrics_ready.wait(), timeout=2)
+            return get_metrics_payload()
+
+    tunnel_state, metrics = await asyncio.gather(fetch_tunnel_state(), wait_for_metrics(), return_exceptions=True)
 
-    return JSONResponse(applications)
+    errors = {}
+    if isinstance(tunnel_state, Exception):
+        errors["tunnels"] = "Error communicating with the API"
+        tunnel_state = {"direct_urls": {}, "named_tunnels": [], "quick_tunnels": []}
+    if isinstance(metrics, Exception):
+        errors["metrics"] = "System metrics are not available yet"
+        metrics = None
+
+    external_ports = {str(app["external_port"]) for app in applications.values()}
+    state = {
+        "applications": applications,
+        "direct_urls": {port: url for port, url in tunnel_state["direct_urls"].items() if port in external_ports},
+        "named_tunnels": tunnel_state["named_tunnels"],
+        "quick_tunnels": tunnel_state["quick_tunnels"],
+        "errors": errors
+    }
+    if include_metrics:
+        state["metrics"] = metrics
+
+    body = json.dumps(state, sort_keys=True, separators=(',', ':')).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @app.get("/get-direct-url/{port}")
 async def get_direct_url(port: int):
     url = f"{tunnel_manager}/get-direct-url/{port}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Direct URL unavailable")
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Direct URL unavailable")
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+
+@app.get("/get-direct-urls")
+async def get_direct_urls():
+    url = f"{tunnel_manager}/get-direct-urls"
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
 
 @app.get("/get-existing-quick-tunnel/{target_url:path}")
 async def get_existing_quick_tunnel(target_url: str):
     url = f"{tunnel_manager}/get-quick-tunnel-if-exists/{target_url}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return HTMLResponse(result['tunnel_url'])
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Tunnel not found")
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
-        
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return HTMLResponse(result['tunnel_url'])
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Tunnel not found")
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    
 @app.get("/get-existing-named-tunnel/{port}")
 async def get_existing_named_tunnel(port: int):
     url = f"{tunnel_manager}/get-named-tunnel/{port}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return HTMLResponse(result['tunnel_url'])
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Tunnel not found")
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
-        
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return HTMLResponse(result['tunnel_url'])
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Tunnel not found")
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    
 @app.get("/get-all-quick-tunnels")
 async def get_all_quick_tunnels():
     url = f"{tunnel_manager}/get-all-quick-tunnels"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                raise HTTPException(status_code=404, detail=f"Tunnel not found")
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
-        
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Tunnel not found")
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    
 
 @app.get("/get-named-tunnels")
 async def get_named_tunnels():
     url = f"{tunnel_manager}/get-named-tunnels"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code in [404, 500]:
-                raise HTTPException(status_code=404, detail=f"Tunnel config not found")
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code in [404, 500]:
+            raise HTTPException(status_code=404, detail=f"Tunnel config not found")
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
 
 
 @app.post("/start-quick-tunnel/{target_url:path}")
 async def start_quick_tunnel(target_url: str):  
     url = f"{tunnel_manager}/get-quick-tunnel/{target_url}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.get(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPError as e:
-            # No stack trace in the live application
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API")
-        except:
-            raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
+    try:
+        response = await tunnel_request("GET", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPError as e:
+        # No stack trace in the live application
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API")
+    except:
+        raise HTTPException(status_code=500, detail=f"Unhandled error response from API")
 
 @app.post("/stop-quick-tunnel/{target_url:path}")
 async def stop_quick_tunnel(target_url: str):
     url = f"{tunnel_manager}/stop-quick-tunnel/{target_url}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.post(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API: {str(e)}")
+    try:
+        response = await tunnel_request("POST", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API: {str(e)}")
 
 @app.post("/refresh-quick-tunnel/{target_url:path}")
 async def refresh_quick_tunnel(target_url: str):
     url = f"{tunnel_manager}/refresh-quick-tunnel/{target_url}"
-    async with httpx.AsyncClient(timeout=tunnel_api_timeout) as client:
-        try:
-            response = await client.post(url)
-            response.raise_for_status()
-            result = response.json()
-            return result
-        except httpx.HTTPError as e:
-            raise HTTPException(status_code=500, detail=f"Error communicating with the API: {str(e)}")
+    try:
+        response = await tunnel_request("POST", url)
+        response.raise_for_status()
+        result = response.json()
+        return result
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Error communicating with the API: {str(e)}")
 
 async def set_external_ip(forwarded_host):
     try:
@@ -427,8 +753,7 @@ async def set_external_ip(forwarded_host):
         ip_obj = ipaddress.IPv4Address(ip)
         if port != os.environ.get("VAST_TCP_PORT_1111"):
             return
-        async with httpx.AsyncClient() as client:
-            response = await client.put(f"{tunnel_manager}/set-public-ip/{ip}")
+        response = await tunnel_request("PUT", f"{tunnel_manager}/set-public-ip/{ip}")
     except Exception:
         return
 
@@ -439,16 +764,26 @@ async def set_external_ip(forwarded_host):
 # Constants
 MAX_LINES = 500  # Maximum lines to keep in buffer
 POLL_INTERVAL = 0.2  # File polling interval in seconds
+RESCAN_INTERVAL = 30  # Seconds between full directory rescans when watching with inotify
 LOG_DIRECTORY = "/var/log/portal"  # Default directory to monitor
+LOG_WATCH_BACKEND = os.environ.get("PORTAL_LOG_WATCH_BACKEND", "auto").lower()  # auto (inotify with polling fallback) or poll
+BROADCAST_BATCH_LINES = 200  # Maximum lines coalesced into a single WebSocket frame
+BROADCAST_WINDOW = 0.1  # Seconds to wait for more lines before sending a frame
+CLIENT_QUEUE_SIZE = 100  # Frames buffered per client before the oldest are dropped
+TAIL_BLOCK_SIZE = 64 * 1024  # Bytes read per step when seeking backwards through a new file
+TAIL_MAX_BYTES = 8 * 1024 * 1024  # Upper bound on bytes read to recover the last MAX_LINES lines
 
 # State for WebSocket and monitoring
-websocket_clients = set()  # Set of connected WebSocket clients
+websocket_clients = {}  # WebSocket -> LogClient for each connected client
 client_tasks = {}  # Client ID to asyncio Task
 chronological_log_buffer = deque(maxlen=MAX_LINES)  # Single buffer for all logs in chronological order
 file_specific_buffers = {}  # Filename -> Deque (for debugging/specific file views if needed)
 file_positions = {}  # Filename -> Last position
 file_mtimes = {}    # Filename -> Last modification time
 monitor_task = None  # Main monitoring task
+log_watch_backend = None  # Backend in use by the monitor: inotify or poll
+pending_log_lines = []  # Formatted lines waiting to be coalesced into the next frame
+log_lines_ready = asyncio.Event()  # Set when pending_log_lines has content
 
 # Helper function to format log lines
 def highlight_log_level(line):
@@ -458,18 +793,44 @@ def highlight_log_level(line):
         return f'<span class="error">{line}</span>'
     return f'<span>{line}</span>'
 
+# Join formatted lines into frames of at most BROADCAST_BATCH_LINES
+def build_frames(lines):
+    return ["".join(lines[i:i + BROADCAST_BATCH_LINES]) for i in range(0, len(lines), BROADCAST_BATCH_LINES)]
+
+class LogClient:
+    """Bounded queue of outgoing frames for a single WebSocket client"""
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.dropped = 0
+
+    def enqueue(self, frame):
+        """Queue a frame without blocking, dropping the oldest when the client has fallen behind"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+    async def send_frames(self):
+        """Send queued frames to the client in order"""
+        while True:
+            frame = await self.queue.get()
+            if self.dropped:
+                skipped, self.dropped = self.dropped, 0
+                await self.websocket.send_text(f'<div class="log-system-message" style="color:orange;text-align:center;font-style:italic;margin:5px 0;border-bottom:1px dotted #ccc;">Skipped {skipped} log updates to catch up</div>')
+            await self.websocket.send_text(frame)
+
 # Dedicated task for each client to handle heartbeats and messages
 async def client_handler(websocket: WebSocket, client_id: int):
     """Handle a single client's WebSocket connection"""
+    client = websocket_clients.get(websocket)
+    if client is None:
+        return
+
+    # Network sends happen here so the log reader never waits on a slow client
+    sender_task = asyncio.create_task(client.send_frames())
+
     try:
-        # Send connection confirmation
-        await websocket.send_text('<div class="log-system-message" style="color:green;text-align:center;font-style:italic;margin:5px 0;border-bottom:1px dotted #ccc;">Connected to log stream</div>')
-        
-        # Send historical logs from the single chronological buffer
-        for line in chronological_log_buffer:
-            html_content = highlight_log_level(line)
-            await websocket.send_text(html_content)
-        
         # Heartbeat loop
         while True:
             # Process any messages from client (including pings)
@@ -480,20 +841,19 @@ async def client_handler(websocket: WebSocket, client_id: int):
                 
                 # If it's a ping, send a pong
                 if message == "ping":
-                    await websocket.send_text("pong")
+                    client.enqueue("pong")
             except asyncio.TimeoutError:
                 # No message received, that's expected
                 pass
             
             # Send heartbeat every 10 seconds
             await asyncio.sleep(10)
-            try:
-                await websocket.send_text("heartbeat")
-                logger.debug(f"Sent heartbeat to client {client_id}")
-            except Exception as e:
-                logger.error(f"Failed to send heartbeat to client {client_id}: {e}")
+            if sender_task.done():
+                logger.error(f"Failed to send to client {client_id}: {sender_task.exception()}")
                 # Connection is probably broken, exit the loop
                 break
+            client.enqueue("heartbeat")
+            logger.debug(f"Queued heartbeat for client {client_id}")
     
     except WebSocketDisconnect:
         logger.info(f"WebSocket client {client_id} disconnected normally")
@@ -502,14 +862,14 @@ async def client_handler(websocket: WebSocket, client_id: int):
     except Exception as e:
         logger.error(f"Error in client handler for {client_id}: {e}", exc_info=True)
     finally:
+        sender_task.cancel()
         # Clean up client state
         remove_client(websocket, client_id)
 
 # Remove a client
 def remove_client(websocket, client_id):
     """Safely remove a client and cancel its task"""
-    if websocket in websocket_clients:
-        websocket_clients.remove(websocket)
+    websocket_clients.pop(websocket, None)
     
     if client_id in client_tasks:
         client_tasks[client_id].cancel()
@@ -537,38 +897,58 @@ async def get_log_files(directory):
         logger.error(f"Error listing directory {directory}: {e}")
         return []
 
-# Send message to all connected clients
-async def broadcast_message(message):
-    """Send a formatted log message to all connected clients in parallel"""
+# Queue a line for all connected clients
+def broadcast_message(message):
+    """Add a formatted log line to the next frame without waiting on any client"""
     if not websocket_clients:
         return
-    
-    # Format the log message
-    html_content = highlight_log_level(message)
-    
-    # Create tasks to send to all clients in parallel
-    send_tasks = []
-    for client in websocket_clients:
-        task = asyncio.create_task(send_to_client(client, html_content))
-        send_tasks.append(task)
-    
-    # Wait for all tasks to complete
-    results = await asyncio.gather(*send_tasks, return_exceptions=True)
-    
-    # Remove any disconnected clients
-    disconnected_clients = set()
-    for client, result in zip(websocket_clients, results):
-        if isinstance(result, Exception):
-            logger.error(f"Error sending to client {id(client)}: {result}")
-            disconnected_clients.add(client)
-    
-    for client in disconnected_clients:
-        websocket_clients.remove(client)
 
-async def send_to_client(client, content):
-    """Helper function to send content to a single client"""
-    await client.send_text(content)
-    return True
+    pending_log_lines.append(highlight_log_level(message))
+    log_lines_ready.set()
+
+# Coalesce pending lines into frames
+async def broadcast_log_frames():
+    """Flush pending log lines to every client's queue by count or time window"""
+    while True:
+        await log_lines_ready.wait()
+
+        # Let a burst accumulate unless a full frame is already waiting
+        if len(pending_log_lines) < BROADCAST_BATCH_LINES:
+            await asyncio.sleep(BROADCAST_WINDOW)
+
+        log_lines_ready.clear()
+        lines = pending_log_lines[:]
+        pending_log_lines.clear()
+
+        for frame in build_frames(lines):
+            for client in list(websocket_clients.values()):
+                client.enqueue(frame)
+
+# Read the end of a file without loading all of it
+def read_last_lines(filepath, max_lines):
+    """Return the last max_lines lines of a file and the offset the read ended at"""
+    with open(filepath, 'rb') as file:
+        end_position = file.seek(0, os.SEEK_END)
+        position = end_position
+        blocks = []
+        newlines = 0
+
+        # Walk backwards a block at a time until we have one more newline than lines needed
+        while position > 0 and newlines <= max_lines and end_position - position < TAIL_MAX_BYTES:
+            read_size = min(TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            file.seek(position)
+            block = file.read(read_size)
+            blocks.append(block)
+            newlines += block.count(b'\n')
+
+    lines = b''.join(reversed(blocks)).decode('utf-8', errors='replace').splitlines()
+
+    # The first line is partial unless we reached the start of the file
+    if position > 0 and lines:
+        lines = lines[1:]
+
+    return lines[-max_lines:], end_position
 
 # Tail a single log file
 async def tail_log_file(filepath):
@@ -591,25 +971,22 @@ async def tail_log_file(filepath):
             logger.info(f"New file: {filename}, size={current_size}")
             file_specific_buffers[filename] = deque(maxlen=MAX_LINES)  # For file-specific tracking
             
-            # For new files, read the last MAX_LINES lines
-            async with aiofiles.open(filepath, 'r') as file:
-                lines = await file.readlines()
-                if len(lines) > MAX_LINES:
-                    lines = lines[-MAX_LINES:]
-                
-                for line in lines:
-                    line = line.strip()
-                    if line:
-                        # Add to file-specific buffer
-                        file_specific_buffers[filename].append(line)
-                        # Add to chronological buffer
-                        chronological_log_buffer.append(line)
-                        # Broadcast to connected clients
-                        await broadcast_message(line)
-                
-                # Set the position to end of file
-                file_positions[filename] = current_size
-                file_mtimes[filename] = current_mtime
+            # For new files, read only the trailing blocks holding the last MAX_LINES lines
+            lines, end_position = await asyncio.to_thread(read_last_lines, filepath, MAX_LINES)
+
+            for line in lines:
+                line = line.strip()
+                if line:
+                    # Add to file-specific buffer
+                    file_specific_buffers[filename].append(line)
+                    # Add to chronological buffer
+                    chronological_log_buffer.append(line)
+                    # Broadcast to connected clients
+                    broadcast_message(line)
+
+            # Set the position to where the read ended
+            file_positions[filename] = end_position
+            file_mtimes[filename] = current_mtime
             
         # File has been modified since last check
         elif current_mtime > last_mtime or current_size != last_position:
@@ -634,7 +1011,7 @@ async def tail_log_file(filepath):
                         # Add to both buffers
                         file_specific_buffers[filename].append(line)
                         chronological_log_buffer.append(line)
-                        await broadcast_message(line)
+                        broadcast_message(line)
                 
                 # Update position and mtime
                 file_positions[filename] = await file.tell()
@@ -646,38 +1023,93 @@ async def tail_log_file(filepath):
     except Exception as e:
         logger.error(f"Error tailing {filepath}: {e}")
 
-# Main monitoring loop
-async def monitor_log_directory(directory):
-    """Main task to monitor log directory and tail files"""
-    logger.info(f"Starting log monitoring in {directory}")
-    
+# Forget a log file that no longer exists
+def forget_log_file(filename):
+    logger.info(f"File {filename} was removed, cleaning up")
+    file_positions.pop(filename, None)
+    file_mtimes.pop(filename, None)
+
+# Tail every log file in the directory
+async def scan_log_directory(directory):
+    """Read new content from all log files and clean up deleted ones"""
+    log_files = await get_log_files(directory)
+
+    for log_file in log_files:
+        filepath = os.path.join(directory, log_file)
+        await tail_log_file(filepath)
+
+    for filename in list(file_positions.keys()):
+        if filename not in log_files:
+            forget_log_file(filename)
+
+def is_log_file(change, path):
+    return path.endswith('.log')
+
+# Event driven monitoring loop
+async def watch_log_directory(directory):
+    """Tail log files only when inotify reports a change to them"""
+    global log_watch_backend
+
+    # Pick up everything written before the watcher started
+    await scan_log_directory(directory)
+    log_watch_backend = "inotify"
+
+    # An empty change set is yielded every RESCAN_INTERVAL so we can reconcile anything missed
+    async for changes in awatch(directory,
+                                watch_filter=is_log_file,
+                                force_polling=False,
+                                recursive=False,
+                                debounce=int(POLL_INTERVAL * 1000),
+                                rust_timeout=RESCAN_INTERVAL * 1000,
+                                yield_on_timeout=True):
+        if not changes:
+            await scan_log_directory(directory)
+            continue
+
+        for change, path in sorted(changes, key=lambda c: c[1]):
+            if change == Change.deleted and not os.path.exists(path):
+                forget_log_file(os.path.basename(path))
+            else:
+                # Created, modified or moved into place
+                await tail_log_file(path)
+
+# Polling monitoring loop
+async def poll_log_directory(directory):
+    """Tail all log files every POLL_INTERVAL seconds"""
+    global log_watch_backend
+    log_watch_backend = "poll"
+
     while True:
         try:
-            # Get current log files
-            log_files = await get_log_files(directory)
-            
-            # Monitor each file
-            for log_file in log_files:
-                filepath = os.path.join(directory, log_file)
-                await tail_log_file(filepath)
-                
-            # Clean up deleted files
-            for filename in list(file_positions.keys()):
-                if filename not in log_files:
-                    logger.info(f"File {filename} was removed, cleaning up")
-                    file_positions.pop(filename, None)
-                    file_mtimes.pop(filename, None)
-            
+            await scan_log_directory(directory)
+
             # Small delay before next poll
             await asyncio.sleep(POLL_INTERVAL)
-            
+
         except asyncio.CancelledError:
-            logger.info("Monitor task cancelled")
-            break
+            raise
         except Exception as e:
-            logger.error(f"Error in monitor_log_directory: {e}")
+            logger.error(f"Error in poll_log_directory: {e}")
             await asyncio.sleep(1)
 
+# Main monitoring task
+async def monitor_log_directory(directory):
+    """Main task to monitor log directory and tail files"""
+    logger.info(f"Starting log monitoring in {directory}")
+
+    try:
+        if LOG_WATCH_BACKEND != "poll":
+            try:
+                await watch_log_directory(directory)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"inotify watcher unavailable for {directory}, falling back to polling: {e}")
+
+        await poll_log_directory(directory)
+    except asyncio.CancelledError:
+        logger.info("Monitor task cancelled")
+
 # WebSocket connection handler
 async def websocket_logs(websocket: WebSocket):
     """Handle a new WebSocket connection"""
@@ -685,7 +1117,14 @@ async def websocket_logs(websocket: WebSocket):
     
     # Generate client ID and add to clients list
     client_id = id(websocket)
-    websocket_clients.add(websocket)
+    client = LogClient(websocket)
+
+    # Queue connection confirmation and history before any live frames can arrive
+    client.enqueue('<div class="log-system-message" style="color:green;text-align:center;font-style:italic;margin:5px 0;border-bottom:1px dotted #ccc;">Connected to log stream</div>')
+    for frame in build_frames([highlight_log_level(line) for line in chronological_log_buffer]):
+        client.enqueue(frame)
+
+    websocket_clients[websocket] = client
     logger.info(f"WebSocket client {client_id} connected, total clients: {len(websocket_clients)}")
     
     # Create a dedicated task for this client
@@ -736,76 +1175,307 @@ async def cleanup_tasks():
 async def logs_websocket(websocket: WebSocket):
     await websocket_logs(websocket)
 
+@app.get("/log-monitor-status")
+async def log_monitor_status():
+    return {
+        "backend": log_watch_backend,
+        "requested_backend": LOG_WATCH_BACKEND,
+        "directory": LOG_DIRECTORY,
+        "files": len(file_positions),
+        "clients": len(websocket_clients)
+    }
+
+## Log download functions
+DOWNLOAD_LOG_DIRECTORY = "/var/log"  # Directory zipped by /download-logs
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes of zip output buffered before a chunk is streamed
+DOWNLOAD_QUEUE_SIZE = 8  # Chunks buffered between the zip thread and the response
+DOWNLOAD_WORKERS = 2  # Concurrent zip threads; further downloads wait for one
+
+# Separate from the default executor so slow download clients can't starve the metrics sampler
+download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="log-zip")
+
+class DownloadCancelled(Exception):
+    pass
+
+class ZipStreamWriter(io.RawIOBase):
+    """Unseekable file object that hands zip output to the event loop in chunks"""
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.buffer = bytearray()
+        self.cancelled = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.cancelled:
+            raise DownloadCancelled()
+        self.buffer += data
+        if len(self.buffer) >= DOWNLOAD_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer and not self.cancelled:
+            chunk = bytes(self.buffer)
+            self.buffer.clear()
+            # Blocks the zip thread while the client is behind, bounding memory use
+            self.put(chunk)
+
+    def put(self, item):
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+
+def select_log_files(log_dir, since=None, max_bytes=None, pattern=None):
+    """Return (path, name in zip, bytes to include or None for the whole file) for each log file"""
+    candidates = []
+    for root, dirs, files in os.walk(log_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if pattern and not fnmatch.fnmatch(os.path.relpath(file_path, log_dir), pattern):
+                continue
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            if since and stat.st_mtime < since.timestamp():
+                continue
+            # Calculate the relative path for the file inside the zip
+            relative_path = os.path.relpath(file_path, os.path.dirname(log_dir))
+            candidates.append((file_path, relative_path, stat.st_size, stat.st_mtime))
+
+    if max_bytes is None:
+        return [(file_path, relative_path, None) for file_path, relative_path, _, _ in candidates]
+
+    # Spend the byte budget on the most recently modified files, keeping the tail of the last one
+    selected = []
+    remaining = max_bytes
+    for file_path, relative_path, size, _ in sorted(candidates, key=lambda c: c[3], reverse=True):
+        if remaining <= 0:
+            break
+        selected.append((file_path, relative_path, None if size <= remaining else remaining))
+        remaining -= size
+    return selected
+
+def write_log_zip(writer, log_dir, since, max_bytes, pattern):
+    """Compress the selected log files into the writer (runs in a worker thread)"""
+    try:
+        with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for file_path, relative_path, limit in select_log_files(log_dir, since, max_bytes, pattern):
+                try:
+                    if limit is None:
+                        zipf.write(file_path, relative_path)
+                        continue
+
+                    zip_info = zipfile.ZipInfo.from_file(file_path, relative_path)
+                    zip_info.compress_type = zipfile.ZIP_DEFLATED
+                    with open(file_path, 'rb') as src, zipf.open(zip_info, 'w', force_zip64=True) as dest:
+                        src.seek(-limit, os.SEEK_END)
+                        while limit > 0:
+                            data = src.read(min(DOWNLOAD_CHUNK_SIZE, limit))
+                            if not data:
+                                break
+                            dest.write(data)
+                            limit -= len(data)
+                except (PermissionError, zipfile.LargeZipFile, OSError) as e:
+                    # Skip files that can't be accessed or are too large
+                    continue
+        writer.flush()
+    except DownloadCancelled:
+        logger.info("Log download cancelled by client")
+    except Exception as e:
+        logger.error(f"Error creating zip file: {e}")
+    finally:
+        if not writer.cancelled:
+            writer.put(None)
+
+async def stream_log_zip(log_dir, since, max_bytes, pattern):
+    """Yield zip chunks as a worker thread compresses the log files"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+    writer = ZipStreamWriter(loop, queue)
+    loop.run_in_executor(download_executor, write_log_zip, writer, log_dir, since, max_bytes, pattern)
+
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # Unblock the zip thread if the client went away mid-download
+        writer.cancelled = True
+        while not queue.empty():
+            queue.get_nowait()
+
 @app.get("/download-logs")
-async def download_logs(filename: str = None):
+async def download_logs(filename: str = None, since: Optional[datetime] = None, max_bytes: Optional[int] = None, pattern: Optional[str] = Query(None, alias="glob")):
     """
-    Zip the /var/log directory and serve it as a downloadable file.
+    Zip the /var/log directory and stream it as a downloadable file.
     
     Parameters:
     - filename: Optional custom filename for the zip file
+    - since: Only include files modified at or after this time (ISO 8601 or Unix timestamp)
+    - max_bytes: Only include this many bytes of log data, newest files first
+    - glob: Only include files whose path relative to /var/log matches this pattern
     """
-    try:
-        # Create a memory buffer to store the zip file
-        zip_buffer = io.BytesIO()
-        
-        # Define the directory to zip
-        log_dir = "/var/log"
-        
-        # Check if the directory exists
-        if not os.path.exists(log_dir):
-            raise HTTPException(status_code=404, detail="Log directory not found")
-        
-        # Use provided filename or generate one with timestamp
-        if not filename:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            zip_filename = f"logs_{timestamp}.zip"
-        else:
-            # Ensure the filename ends with .zip
-            zip_filename = filename if filename.endswith('.zip') else f"{filename}.zip"
-        
-        # Create a zip file in the memory buffer
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through the directory and add all files to the zip
-            for root, dirs, files in os.walk(log_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Calculate the relative path for the file inside the zip
-                    relative_path = os.path.relpath(file_path, os.path.dirname(log_dir))
-                    try:
-                        zipf.write(file_path, relative_path)
-                    except (PermissionError, zipfile.LargeZipFile, OSError) as e:
-                        # Skip files that can't be accessed or are too large
-                        continue
-        
-        # Reset the buffer position to the beginning
-        zip_buffer.seek(0)
-        
-        # Return the zip file as a downloadable response
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/zip",
-            headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
-        )
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating zip file: {str(e)}")
+    # Check if the directory exists
+    if not os.path.exists(DOWNLOAD_LOG_DIRECTORY):
+        raise HTTPException(status_code=404, detail="Log directory not found")
 
-@app.get("/system-metrics")
-async def get_system_metrics():
+    if max_bytes is not None and max_bytes <= 0:
+        raise HTTPException(status_code=400, detail="max_bytes must be positive")
+
+    # Use provided filename or generate one with timestamp
+    if not filename:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        zip_filename = f"logs_{timestamp}.zip"
+    else:
+        # Ensure the filename ends with .zip
+        zip_filename = filename if filename.endswith('.zip') else f"{filename}.zip"
+
+    # Entries are compressed off the event loop and streamed as they are produced
+    return StreamingResponse(
+        stream_log_zip(DOWNLOAD_LOG_DIRECTORY, since, max_bytes, pattern),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+    )
+
+## System metrics functions
+METRICS_INTERVAL = float(os.environ.get("PORTAL_METRICS_INTERVAL", "2"))  # Seconds between background samples
+METRICS_HISTORY_SECONDS = int(os.environ.get("PORTAL_METRICS_HISTORY", "3600"))  # Seconds of samples kept for /system-metrics/history
+MAX_HISTORY_BUCKETS = 1000  # Upper bound on buckets returned by a single history request
+METRICS_PUSH_INTERVAL = 5  # Default seconds between /ws-metrics updates
+METRICS_PUSH_MAX_INTERVAL = 60  # Slowest rate a /ws-metrics client can negotiate
+
+metrics_snapshot = None  # Latest sampled metrics, shared by all requests
+metrics_sampled_at = 0  # Unix time the snapshot was taken
+metrics_ready = asyncio.Event()  # Set once the first snapshot exists
+
+class MetricsHistory:
+    """Fixed-size ring buffer of metric samples backed by NumPy arrays"""
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = {}  # Series name -> column index
+        self.times = np.zeros(capacity)
+        self.values = np.full((capacity, 0), np.nan)
+        self.index = 0  # Next row to write
+        self.count = 0  # Rows holding samples
+
+    def append(self, timestamp, values):
+        new_columns = [name for name in values if name not in self.columns]
+        if new_columns:
+            # Only happens when a device appears, so the copy is rare
+            for name in new_columns:
+                self.columns[name] = len(self.columns)
+            padding = np.full((self.capacity, len(new_columns)), np.nan)
+            self.values = np.hstack([self.values, padding])
+
+        row = self.index
+        self.times[row] = timestamp
+        self.values[row, :] = np.nan
+        for name, value in values.items():
+            if value is not None:
+                self.values[row, self.columns[name]] = value
+
+        self.index = (self.index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def query(self, window, step):
+        """Return min/max/mean per step-sized bucket over the last window seconds"""
+        if self.count == 0:
+            return [], {}
+
+        # Rows in chronological order
+        order = (np.arange(self.count) + self.index - self.count) % self.capacity
+        end = self.times[order[-1]]
+        start = end - window
+        order = order[self.times[order] > start]
+
+        times = self.times[order]
+        values = self.values[order]
+        buckets = ((times - start) // step).astype(np.int64)
+
+        # Samples are sorted by time so each bucket is a contiguous run of rows
+        bucket_ids, bucket_starts = np.unique(buckets, return_index=True)
+        present = ~np.isnan(values)
+        counts = np.add.reduceat(present, bucket_starts, axis=0)
+        sums = np.add.reduceat(np.where(present, values, 0), bucket_starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+            minimums = np.fmin.reduceat(values, bucket_starts, axis=0)
+            maximums = np.fmax.reduceat(values, bucket_starts, axis=0)
+
+        timestamps = (start + bucket_ids * step).tolist()
+        series = {}
+        for name, column in self.columns.items():
+            series[name] = {
+                'min': nan_to_none(minimums[:, column]),
+                'max': nan_to_none(maximums[:, column]),
+                'mean': nan_to_none(means[:, column])
+            }
+        return timestamps, series
+
+def nan_to_none(array):
+    return [None if np.isnan(value) else round(float(value), 3) for value in array]
+
+metrics_history = MetricsHistory(max(1, int(METRICS_HISTORY_SECONDS / METRICS_INTERVAL)))
+
+def get_history_values(metrics):
+    """Flatten a metrics snapshot into the series stored in metrics_history"""
+    values = {
+        'cpu_percent': metrics['cpu']['percent'],
+        'ram_percent': metrics['ram']['percent'],
+        'disk_percent': metrics['disk']['percent']
+    }
+    for index, device in enumerate(metrics['gpu'].get('devices', [])):
+        values[f'gpu{index}_load_percent'] = device['load_percent']
+        values[f'gpu{index}_memory_percent'] = device['memory_percent']
+        values[f'gpu{index}_temperature'] = device['temperature']
+        values[f'gpu{index}_power_draw'] = device['power_draw']
+    return values
+
+def get_gpu_device_metrics(gpu):
+    """Per-GPU metrics in the same units as the aggregate values"""
+    memory_total = getattr(gpu, 'memoryTotal_mb', gpu.memoryTotal)
+    memory_used = getattr(gpu, 'memoryUsed_mb', gpu.memoryUsed)
+    return {
+        'id': gpu.id,
+        'name': gpu.name,
+        'load_percent': float(gpu.load * 100),
+        'memory_used': float(memory_used),
+        'memory_total': float(memory_total),
+        'memory_percent': float(memory_used / memory_total * 100) if memory_total else 0,
+        'temperature': getattr(gpu, 'temperature', None),
+        'power_draw': getattr(gpu, 'powerDraw', None),
+        'power_limit': getattr(gpu, 'powerLimit', None)
+    }
+
+def sample_system_metrics():
+    """Collect RAM, disk and GPU metrics (blocking, runs in a worker thread)"""
     # Try to get container memory metrics first
     container_memory = get_container_memory_stats()
     
+    if not container_memory:
+        virtual_memory = psutil.virtual_memory()
+        container_memory = {
+            'total': virtual_memory.total,
+            'used': virtual_memory.used,
+            'percent': virtual_memory.percent
+        }
+    disk_usage = psutil.disk_usage('/')
+
     # Initialize metrics dictionary with memory info
     metrics = {
-        'ram': container_memory if container_memory else {
-            'total': psutil.virtual_memory().total,
-            'used': psutil.virtual_memory().used,
-            'percent': psutil.virtual_memory().percent
-        },
+        'ram': container_memory,
         'disk': {
-            'total': psutil.disk_usage('/').total,
-            'used': psutil.disk_usage('/').used,
-            'percent': psutil.disk_usage('/').percent
+            'total': disk_usage.total,
+            'used': disk_usage.used,
+            'percent': disk_usage.percent
+        },
+        # Utilisation since the previous sample, so this never blocks
+        'cpu': {
+            'percent': psutil.cpu_percent(interval=None)
         }
     }
     
@@ -814,12 +1484,14 @@ async def get_system_metrics():
     
     # Get GPU metrics from both NVIDIA and AMD sources
     all_gpus = []
+    nvidia_gpus = []
+    rocm_gpus = []
     nvidia_error = None
     rocm_error = None
     
     # Try to get NVIDIA GPUs
     try:
-        nvidia_gpus = GPUtil.getGPUs()
+        nvidia_gpus = get_gpu_provider().get_gpus()
         all_gpus.extend(nvidia_gpus)
     except Exception as e:
         nvidia_error = str(e)
@@ -861,12 +1533,13 @@ async def get_system_metrics():
             'memory_used': float(used_memory),
             'memory_total': float(total_memory),
             'memory_percent': float(memory_percent),
-            'memory_unit': 'MB'  # Add unit for clarity
+            'memory_unit': 'MB',  # Add unit for clarity
+            'devices': [get_gpu_device_metrics(gpu) for gpu in all_gpus]
         }
         
         # Add GPU details by type
-        nvidia_count = len([gpu for gpu in all_gpus if hasattr(gpu, 'id') and not isinstance(gpu.id, str)])
-        rocm_count = len(all_gpus) - nvidia_count
+        nvidia_count = len(nvidia_gpus)
+        rocm_count = len(rocm_gpus)
         
         if nvidia_count > 0:
             metrics['gpu']['nvidia_count'] = nvidia_count
@@ -893,15 +1566,161 @@ async def get_system_metrics():
         if errors:
             metrics['gpu']['errors'] = errors
 
+    return metrics
+
+async def sample_metrics_loop():
+    """Refresh the shared metrics snapshot every METRICS_INTERVAL seconds"""
+    global metrics_snapshot, metrics_sampled_at
+
+    try:
+        await asyncio.to_thread(init_gpu_providers)
+    except Exception as e:
+        logger.error(f"Error detecting GPUs: {e}")
+
+    while True:
+        try:
+            metrics_snapshot = await asyncio.to_thread(sample_system_metrics)
+            metrics_sampled_at = time.time()
+            metrics_history.append(metrics_sampled_at, get_history_values(metrics_snapshot))
+            metrics_ready.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sampling system metrics: {e}")
+
+        await asyncio.sleep(METRICS_INTERVAL)
+
+@app.get("/system-metrics")
+async def get_system_metrics():
+    # Served from the background snapshot so requests never sample directly
+    try:
+        await asyncio.wait_for(metrics_ready.wait(), timeout=METRICS_INTERVAL + 10)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="System metrics are not available yet")
+
+    metrics = get_metrics_payload()
+    metrics['age'] = round(time.time() - metrics_sampled_at, 3)
     return JSONResponse(content=metrics)
 
+def get_metrics_payload():
+    metrics = dict(metrics_snapshot)
+    metrics['sampled_at'] = metrics_sampled_at
+    return metrics
+
+def diff_metrics(previous, current):
+    """Return the parts of current that differ from previous; removed keys map to None"""
+    delta = {}
+    for key, value in current.items():
+        old_value = previous.get(key)
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested = diff_metrics(old_value, value)
+            if nested:
+                delta[key] = nested
+        elif key not in previous or value != old_value:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+def clamp_push_interval(interval):
+    try:
+        interval = float(interval)
+    except (TypeError, ValueError):
+        interval = METRICS_PUSH_INTERVAL
+    # Pushing faster than we sample would only resend the same snapshot
+    return min(max(interval, METRICS_INTERVAL), METRICS_PUSH_MAX_INTERVAL)
+
+@app.websocket("/ws-metrics")
+async def metrics_websocket(websocket: WebSocket, interval: float = METRICS_PUSH_INTERVAL):
+    """Push the shared metrics snapshot, then deltas, at a client-negotiated rate"""
+    await websocket.accept()
+    client_id = id(websocket)
+    settings = {'interval': clamp_push_interval(interval)}
+
+    # Clients may renegotiate with {"interval": seconds}; disconnects end this task
+    async def receive_settings():
+        try:
+            while True:
+                message = await websocket.receive_text()
+                try:
+                    settings['interval'] = clamp_push_interval(json.loads(message).get('interval'))
+                except (ValueError, AttributeError):
+                    logger.debug(f"Ignoring metrics message from client {client_id}: {message[:50]}")
+        except WebSocketDisconnect:
+            logger.debug(f"Metrics client {client_id} disconnected")
+
+    receiver_task = asyncio.create_task(receive_settings())
+    last_sent = None
+    last_interval = None
+
+    try:
+        await metrics_ready.wait()
+        while not receiver_task.done():
+            payload = get_metrics_payload()
+            if last_sent is None:
+                await websocket.send_json({'type': 'snapshot', 'interval': settings['interval'], 'data': payload})
+            else:
+                message = {'type': 'delta', 'data': diff_metrics(last_sent, payload)}
+                if settings['interval'] != last_interval:
+                    message['interval'] = settings['interval']
+                if message['data'] or 'interval' in message:
+                    await websocket.send_json(message)
+            last_sent = payload
+            last_interval = settings['interval']
+
+            await asyncio.wait({receiver_task}, timeout=settings['interval'])
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in metrics websocket for client {client_id}: {e}")
+    finally:
+        receiver_task.cancel()
+
+@app.get("/system-metrics/history")
+async def get_system_metrics_history(window: float = 600, step: float = 10):
+    """
+    Downsampled metric series from the background sampler.
+
+    Parameters:
+    - window: Seconds of history to return, ending at the latest sample
+    - step: Bucket width in seconds; each bucket reports min, max and mean
+    """
+    if not (math.isfinite(window) and math.isfinite(step)) or window <= 0 or step <= 0:
+        raise HTTPException(status_code=400, detail="window and step must be positive numbers")
+
+    # Keep responses bounded no matter what the client asks for
+    window = min(window, METRICS_HISTORY_SECONDS)
+    step = max(step, window / MAX_HISTORY_BUCKETS, METRICS_INTERVAL)
+    timestamps, series = metrics_history.query(window, step)
+
+    return JSONResponse(content={
+        'window': window,
+        'step': step,
+        'timestamps': timestamps,
+        'series': series
+    })
+
 @app.on_event("startup")
 async def startup_event():
     app.state.monitor_task = asyncio.create_task(
-        monitor_log_directory("/var/log/portal")
+        monitor_log_directory(LOG_DIRECTORY)
     )
+    app.state.broadcast_task = asyncio.create_task(broadcast_log_frames())
+    app.state.metrics_task = asyncio.create_task(sample_metrics_loop())
+    app.state.config_task = asyncio.create_task(portal_config.watch_applications())
+    get_tunnel_client()
 
 @app.on_event("shutdown") 
 async def shutdown_event():
     if hasattr(app.state, 'monitor_task'):
         app.state.monitor_task.cancel()
+    if hasattr(app.state, 'broadcast_task'):
+        app.state.broadcast_task.cancel()
+    if hasattr(app.state, 'metrics_task'):
+        app.state.metrics_task.cancel()
+    if hasattr(app.state, 'config_task'):
+        app.state.config_task.cancel()
+    close_gpu_provider()
+    download_executor.shutdown(wait=False, cancel_futures=True)
+    await close_tunnel_client()
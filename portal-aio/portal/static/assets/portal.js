@@ -1,5 +1,37 @@
 // Create a namespace for your application
 window.InstancePortal = (function() {
+    // Batched dashboard state so page load is a single request
+    const dashboardState = {
+        data: null,
+        etag: null,
+        changed: false,
+        
+        // Returns the latest state, or null if the endpoint is unavailable
+        fetch: async function(includeMetrics = true) {
+            try {
+                const headers = this.etag ? { 'If-None-Match': this.etag } : {};
+                const response = await fetch(`/dashboard-state?include_metrics=${includeMetrics}`, { headers: headers });
+                
+                if (response.status === 304 && this.data) {
+                    this.changed = false;
+                    return this.data;
+                }
+                
+                if (!response.ok) {
+                    throw new Error(`HTTP error! Status: ${response.status}`);
+                }
+                
+                this.etag = response.headers.get('ETag');
+                this.data = await response.json();
+                this.changed = true;
+                return this.data;
+            } catch (error) {
+                console.error('Error fetching dashboard state:', error);
+                return null;
+            }
+        }
+    };
+    
     const applications = {
         // Store for application data
         _data: {},
@@ -7,9 +39,14 @@ window.InstancePortal = (function() {
         // Initialize applications
         init: async function() {
             try {
-                await this.fetchApplications();
-                this.renderAppGrid();
-                await this.fetchDirectUrls();
+                const state = await dashboardState.fetch();
+                if (state) {
+                    await this.applyState(state, true);
+                } else {
+                    await this.fetchApplications();
+                    this.renderAppGrid();
+                    await this.fetchDirectUrls();
+                }
                 this.updateAllUI();
                 
                 // Optionally set up a refresh interval
@@ -44,6 +81,30 @@ window.InstancePortal = (function() {
             }
         },
         
+        // Load applications and direct URLs from the batched dashboard state
+        applyState: async function(state, render = false) {
+            this._data = state.applications;
+            this._enhanceApplications();
+            
+            if (render) {
+                this.renderAppGrid();
+            }
+            
+            // Tunnel manager may still be starting, so fall back to retrying per application
+            if (state.errors && state.errors.tunnels) {
+                await this.fetchDirectUrls();
+                return;
+            }
+            
+            for (const [appName, app] of Object.entries(this._data)) {
+                const directUrl = state.direct_urls[String(app.external_port)];
+                app.direct_url = directUrl || null;
+                if (!directUrl) {
+                    app.direct_url_error = 'Failed to retrieve direct URL';
+                }
+            }
+        },
+        
         // Render the application grid
         renderAppGrid: function() {
             const appGrid = document.getElementById('app-grid');
@@ -307,39 +368,37 @@ window.InstancePortal = (function() {
             const MAX_RETRIES = 5;
             const RETRY_DELAY = 2000; // 2 seconds
             
-            for (const [appName, app] of Object.entries(this._data)) {
-                let success = false;
-                
-                for (let attempt = 1; attempt <= MAX_RETRIES && !success; attempt++) {
-                    try {
-                        const response = await fetch(`/get-direct-url/${app.external_port}`);
-                        
-                        if (response.ok) {
-                            const data = await response.json();
-                            
-                            // Store the direct URL using the setter
-                            app.direct_url = data.result;
-                            success = true;
-                        } else {
-                            if (attempt < MAX_RETRIES) {
-                                console.log(`Tunnels server not available for ${appName} direct URL (attempt ${attempt}/${MAX_RETRIES}). Retrying in ${RETRY_DELAY/1000} seconds...`);
-                                await new Promise(resolve => setTimeout(resolve, RETRY_DELAY));
-                            } else {
-                                app.direct_url = null;
-                                app.direct_url_error = 'Failed to retrieve direct URL';
-                                console.log(`Tunnels server not available for ${appName} direct URL. Giving up after ${MAX_RETRIES} attempts.`);
-                            }
+            // One request returns the URL for every exposed port
+            for (let attempt = 1; attempt <= MAX_RETRIES; attempt++) {
+                try {
+                    const response = await fetch('/get-direct-urls');
+                    
+                    if (!response.ok) {
+                        throw new Error(`Failed to fetch direct URLs: ${response.statusText}`);
+                    }
+                    
+                    const data = await response.json();
+                    
+                    for (const [appName, app] of Object.entries(this._data)) {
+                        // Store the direct URL using the setter
+                        const directUrl = data.result[String(app.external_port)];
+                        app.direct_url = directUrl || null;
+                        if (!directUrl) {
+                            app.direct_url_error = 'Failed to retrieve direct URL';
                         }
-                    } catch (error) {
-                        if (attempt < MAX_RETRIES) {
-                            console.log(`Tunnels server not available for ${appName} direct URL (attempt ${attempt}/${MAX_RETRIES}). Retrying in ${RETRY_DELAY/1000} seconds...`);
-                            await new Promise(resolve => setTimeout(resolve, RETRY_DELAY));
-                        } else {
-                            console.error(`Error fetching direct URL for ${appName}:`, error);
+                    }
+                    return;
+                } catch (error) {
+                    if (attempt < MAX_RETRIES) {
+                        console.log(`Tunnels server not available for direct URLs (attempt ${attempt}/${MAX_RETRIES}). Retrying in ${RETRY_DELAY/1000} seconds...`);
+                        await new Promise(resolve => setTimeout(resolve, RETRY_DELAY));
+                    } else {
+                        console.error('Error fetching direct URLs:', error);
+                        for (const app of Object.values(this._data)) {
                             app.direct_url = null;
                             app.direct_url_error = 'Connection error';
-                            console.log(`Tunnels server not available for ${appName} direct URL. Giving up after ${MAX_RETRIES} attempts.`);
                         }
+                        console.log(`Tunnels server not available for direct URLs. Giving up after ${MAX_RETRIES} attempts.`);
                     }
                 }
             }
@@ -363,8 +422,17 @@ window.InstancePortal = (function() {
         
         // Refresh data
         refreshData: async function() {
-            await this.fetchApplications();
-            await this.fetchDirectUrls();
+            // Metrics are pushed over /ws-metrics, leaving them out keeps the ETag stable
+            const state = await dashboardState.fetch(false);
+            if (state) {
+                if (!dashboardState.changed) {
+                    return;
+                }
+                await this.applyState(state);
+            } else {
+                await this.fetchApplications();
+                await this.fetchDirectUrls();
+            }
             this.updateAllUI();
         }
     };
@@ -438,6 +506,14 @@ window.InstancePortal = (function() {
             return tunnel;
         },
 
+        // Store tunnel objects keyed by target URL
+        _loadTunnels: function(type, tunnelsData) {
+            const store = type === 'named' ? this.named_tunnels : this.quick_tunnels;
+            tunnelsData.forEach(tunnelData => {
+                store[tunnelData.targetUrl] = this._createTunnelObject(type, tunnelData.targetUrl, tunnelData.tunnelUrl);
+            });
+        },
+
         // API Methods
         fetchNamedTunnels: async function() {
             const MAX_RETRIES = 5;
@@ -460,10 +536,7 @@ window.InstancePortal = (function() {
                     const tunnelsData = await response.json();
                     
                     // Process each tunnel and associate with applications
-                    tunnelsData.forEach(tunnelData => {
-                        const tunnel = this._createTunnelObject('named', tunnelData.targetUrl, tunnelData.tunnelUrl);
-                        this.named_tunnels[tunnelData.targetUrl] = tunnel;
-                    });
+                    this._loadTunnels('named', tunnelsData);
                     
                     return Object.values(this.named_tunnels);
                 } catch (error) {
@@ -493,10 +566,7 @@ window.InstancePortal = (function() {
                     const tunnelsData = await response.json();
                     
                     // Process each tunnel and associate with applications
-                    tunnelsData.forEach(tunnelData => {
-                        const tunnel = this._createTunnelObject('quick', tunnelData.targetUrl, tunnelData.tunnelUrl);
-                        this.quick_tunnels[tunnelData.targetUrl] = tunnel;
-                    });
+                    this._loadTunnels('quick', tunnelsData);
                     
                     return Object.values(this.quick_tunnels);
                 } catch (error) {
@@ -760,8 +830,14 @@ window.InstancePortal = (function() {
         // Initialize the tunnels object
         init: async function() {
             this.ui.parent = this;
-            // Fetch existing tunnels first
-            await this.fetch();
+            // Use tunnels from the dashboard state when available, otherwise fetch them
+            const state = dashboardState.data;
+            if (state && !(state.errors && state.errors.tunnels)) {
+                this._loadTunnels('named', state.named_tunnels);
+                this._loadTunnels('quick', state.quick_tunnels);
+            } else {
+                await this.fetch();
+            }
             
             // Check status of all tunnels
             await this.checkAllTunnelStatus();
@@ -1174,6 +1250,54 @@ window.InstancePortal = (function() {
             }
         },
         
+        // Merge a delta pushed by the server into the current data
+        applyDelta: function(target, delta) {
+            for (const [key, value] of Object.entries(delta)) {
+                if (value && typeof value === 'object' && !Array.isArray(value) &&
+                    target[key] && typeof target[key] === 'object' && !Array.isArray(target[key])) {
+                    this.applyDelta(target[key], value);
+                } else {
+                    target[key] = value;
+                }
+            }
+        },
+        
+        // Receive metrics over a WebSocket, falling back to polling if it is unavailable
+        connect: function(interval = 5000) {
+            const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+            const wsUrl = `${protocol}//${window.location.host}/ws-metrics?interval=${interval / 1000}`;
+            
+            try {
+                this.webSocket = new WebSocket(wsUrl);
+            } catch (error) {
+                console.error('Failed to create metrics WebSocket:', error);
+                this.startUpdates(interval);
+                return;
+            }
+            
+            this.webSocket.addEventListener('open', () => {
+                this.stopUpdates();
+            });
+            
+            this.webSocket.addEventListener('message', (event) => {
+                const message = JSON.parse(event.data);
+                if (message.type === 'snapshot') {
+                    this.data = message.data;
+                } else if (message.type === 'delta') {
+                    this.applyDelta(this.data, message.data);
+                }
+                this.updateUI();
+            });
+            
+            this.webSocket.addEventListener('close', () => {
+                this.webSocket = null;
+                // Poll until the push stream is back
+                this.startUpdates(interval);
+                clearTimeout(this._reconnectTimer);
+                this._reconnectTimer = setTimeout(() => this.connect(interval), 30000);
+            });
+        },
+        
         // Start periodic updates
         startUpdates: async function(interval = 5000) {
             // Clear any existing interval
@@ -1203,7 +1327,12 @@ window.InstancePortal = (function() {
         
         // Initialize the system metrics module
         init: function() {
-            this.startUpdates();
+            // Show the metrics that arrived with the dashboard state straight away
+            if (dashboardState.data && dashboardState.data.metrics) {
+                this.data = dashboardState.data.metrics;
+                this.updateUI();
+            }
+            this.connect();
             return this;
         }
     };
@@ -1356,10 +1485,14 @@ window.InstancePortal = (function() {
             const temp = document.createElement('div');
             temp.innerHTML = html;
             
-            // Add the log entry to the console
+            // Add the log entries to the console (frames may batch many lines)
             if (temp.firstChild) {
-                logConsole.appendChild(temp.firstChild);
-                
+                const fragment = document.createDocumentFragment();
+                while (temp.firstChild) {
+                    fragment.appendChild(temp.firstChild);
+                }
+                logConsole.appendChild(fragment);
+
                 // Remove old entries to keep memory usage reasonable
                 while (logConsole.childElementCount > this.maxLogLines) {
                     logConsole.removeChild(logConsole.firstChild);
@@ -0,0 +1,294 @@
+"""
+Shared model of /etc/portal.yaml for the portal, tunnel_manager and caddy_manager.
+
+Each service calls load_applications() and gets the same validated, read-only
+Application objects. The file is parsed again only when its mtime, inode or
+size changes, and subscribers are told whenever the applications change.
+"""
+import os
+import re
+import asyncio
+import yaml
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
+
+from watchfiles import awatch, watch
+
+PORTAL_CONFIG_PATH = os.environ.get("PORTAL_CONFIG_PATH", "/etc/portal.yaml")
+
+class ConfigError(ValueError):
+    pass
+
+def get_scheme():
+    if os.environ.get("ENABLE_HTTPS", "false").lower() != "true":
+        scheme = "http"
+    else:
+        scheme = "https"
+    return scheme
+
+def parse_port(app_name: str, key: str, value) -> int:
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"Application '{app_name}': {key} must be a port number, got {value!r}")
+    if not 0 < port < 65536:
+        raise ConfigError(f"Application '{app_name}': {key} {port} is out of range")
+    return port
+
+DURATION_PATTERN = re.compile(r'^(0|(\d+(\.\d+)?(ns|us|µs|ms|s|m|h))+)$')  # Go durations as Caddy accepts them
+SIZE_PATTERN = re.compile(r'^\d+(\.\d+)?([kKmMgG]i?[bB]|[bB])?$')  # No spaces, which would split the Caddyfile token
+
+@dataclass(frozen=True)
+class ProxySettings:
+    """Per-application reverse proxy tuning from the optional 'proxy' key in portal.yaml"""
+    health_uri: Optional[str] = None  # Active health check path; unhealthy upstreams get the 502 page without a request being attempted
+    health_interval: Optional[str] = None
+    health_timeout: Optional[str] = None
+    lb_try_duration: Optional[str] = None  # Keep retrying a starting upstream this long before failing the request
+    keepalive: Optional[str] = None  # Idle upstream connection lifetime
+    keepalive_idle_conns: Optional[int] = None  # Idle upstream connections kept warm
+    flush_interval: Optional[str] = None  # -1 streams responses immediately, e.g. for progress updates
+    request_buffers: Optional[str] = None  # Request body bytes to buffer before proxying; 0 streams uploads
+    response_buffers: Optional[str] = None
+
+    durations = ("health_interval", "health_timeout", "lb_try_duration", "keepalive", "flush_interval")
+    sizes = ("request_buffers", "response_buffers")
+
+    @classmethod
+    def from_dict(cls, app_name: str, data) -> "ProxySettings":
+        if not isinstance(data, dict):
+            raise ConfigError(f"Application '{app_name}': proxy must be a mapping")
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ConfigError(f"Application '{app_name}': unknown proxy settings {', '.join(sorted(unknown))}")
+
+        values = {}
+        for key, value in data.items():
+            if value is None:
+                continue
+            if key in cls.durations:
+                value = str(value)
+                # Only flush_interval has the special -1 (flush immediately)
+                if not DURATION_PATTERN.match(value) and not (key == "flush_interval" and value == "-1"):
+                    raise ConfigError(f"Application '{app_name}': proxy {key} must be a duration like 10s or 500ms, got {value!r}")
+            elif key in cls.sizes:
+                value = str(value)
+                if not SIZE_PATTERN.match(value):
+                    raise ConfigError(f"Application '{app_name}': proxy {key} must be a size like 0 or 4MB, got {value!r}")
+            elif key == "keepalive_idle_conns":
+                if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                    raise ConfigError(f"Application '{app_name}': proxy keepalive_idle_conns must be a non-negative integer")
+            elif key == "health_uri":
+                value = str(value)
+                if not value.startswith('/') or any(char.isspace() for char in value):
+                    raise ConfigError(f"Application '{app_name}': proxy health_uri must be a path starting with / and without spaces")
+            values[key] = value
+        return cls(**values)
+
+    def to_config(self) -> dict:
+        return {key: value for key, value in self.__dict__.items() if value is not None}
+
+@dataclass(frozen=True)
+class Application:
+    name: str
+    hostname: str
+    external_port: int
+    internal_port: int
+    open_path: str = "/"
+    proxy: ProxySettings = field(default_factory=ProxySettings)
+    extra: Mapping = field(default_factory=lambda: MappingProxyType({}))  # Keys this model doesn't know, passed through untouched
+
+    @classmethod
+    def from_dict(cls, app_name: str, data) -> "Application":
+        if not isinstance(data, dict):
+            raise ConfigError(f"Application '{app_name}' must be a mapping")
+        hostname = data.get("hostname")
+        if not hostname or not isinstance(hostname, str):
+            raise ConfigError(f"Application '{app_name}': hostname is required")
+
+        known = {"name", "hostname", "external_port", "internal_port", "open_path", "proxy", "target_url", "mapped_port"}
+        return cls(
+            name=str(data.get("name", app_name)),
+            hostname=hostname,
+            external_port=parse_port(app_name, "external_port", data.get("external_port")),
+            internal_port=parse_port(app_name, "internal_port", data.get("internal_port")),
+            open_path=str(data.get("open_path", "/")),
+            proxy=ProxySettings.from_dict(app_name, data.get("proxy") or {}),
+            extra=MappingProxyType({k: v for k, v in data.items() if k not in known})
+        )
+
+    @property
+    def target_url(self) -> str:
+        # Jupyter's self-signed port is always served over https
+        if self.external_port == self.internal_port and self.internal_port == 8080:
+            scheme = "https"
+        else:
+            scheme = get_scheme()
+        return f"{scheme}://{self.hostname}:{self.external_port}"
+
+    @property
+    def mapped_port(self) -> str:
+        return os.environ.get(f"VAST_TCP_PORT_{self.external_port}", "")
+
+    def to_config(self) -> dict:
+        """The portal.yaml form of this application"""
+        config = {
+            "hostname": self.hostname,
+            "external_port": self.external_port,
+            "internal_port": self.internal_port,
+            "open_path": self.open_path,
+            "name": self.name,
+            **self.extra
+        }
+        proxy = self.proxy.to_config()
+        if proxy:
+            config["proxy"] = proxy
+        return config
+
+    def to_dict(self) -> dict:
+        """The portal.yaml form plus the derived fields the services publish"""
+        return {**self.to_config(), "target_url": self.target_url, "mapped_port": self.mapped_port}
+
+def parse_applications(document) -> Mapping[str, Application]:
+    """Validate a parsed portal.yaml document; an empty file has no applications"""
+    if document is None:
+        return MappingProxyType({})
+    if not isinstance(document, dict) or not isinstance(document.get("applications") or {}, dict):
+        raise ConfigError("portal.yaml must contain an 'applications' mapping")
+    applications = document.get("applications") or {}
+    return MappingProxyType({app_name: Application.from_dict(app_name, app) for app_name, app in applications.items()})
+
+def parse_portal_config_string(apps_string: str) -> Mapping[str, Application]:
+    """Parse the PORTAL_CONFIG format: hostname:external_port:internal_port:path:name entries joined by |"""
+    applications = {}
+    for app_string in apps_string.split('|'):
+        try:
+            hostname, ext_port, int_port, path, name = app_string.split(':', 4)
+        except ValueError:
+            raise ConfigError(f"PORTAL_CONFIG entry {app_string!r} must be hostname:external_port:internal_port:path:name")
+        applications[name] = Application.from_dict(name, {
+            'hostname': hostname,
+            'external_port': ext_port,
+            'internal_port': int_port,
+            'open_path': str(path),
+            'name': name
+        })
+    return MappingProxyType(applications)
+
+def write_applications(applications: Mapping[str, Application], path: Optional[str] = None):
+    path = path or PORTAL_CONFIG_PATH
+    yaml_data = {"applications": {app_name: app.to_config() for app_name, app in applications.items()}}
+    with open(path, "w") as file:
+        yaml.dump(yaml_data, file, default_flow_style=False, sort_keys=False)
+
+config_cache = {"key": None, "applications": None}  # Last good parse and the file identity it came from
+subscribers: list = []
+
+def subscribe(callback: Callable[[Mapping[str, Application]], None]):
+    """Call callback(applications) each time a parse produces different applications"""
+    subscribers.append(callback)
+
+def notify_subscribers(applications: Mapping[str, Application]):
+    for callback in list(subscribers):
+        try:
+            callback(applications)
+        except Exception as e:
+            print(f"Config change handler {getattr(callback, '__name__', callback)} failed: {e}")
+
+def load_applications(path: Optional[str] = None) -> Optional[Mapping[str, Application]]:
+    """Return the applications, or None while the file doesn't exist.
+
+    A file that fails validation raises ConfigError unless an earlier good parse
+    exists, in which case that is kept until the file is fixed.
+    """
+    path = path or PORTAL_CONFIG_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    cache_key = (path, stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    if config_cache["key"] == cache_key:
+        return config_cache["applications"]
+
+    previous = config_cache["applications"]
+    config_cache["key"] = cache_key
+    try:
+        with open(path, 'r') as file:
+            applications = parse_applications(yaml.safe_load(file))
+    except (yaml.YAMLError, ConfigError, OSError) as e:
+        if previous is None:
+            config_cache["key"] = None
+            raise ConfigError(f"Invalid {path}: {e}")
+        print(f"Ignoring invalid {path}, keeping the previous configuration: {e}")
+        return previous
+
+    config_cache["applications"] = applications
+    if applications != previous:
+        notify_subscribers(applications)
+    return applications
+
+def config_watch_targets(path: str):
+    """The config path and, when it is a symlink, the file it resolves to, plus the directories to watch for them"""
+    paths = {path, os.path.realpath(path)}
+    directories = {os.path.dirname(p) for p in paths if os.path.isdir(os.path.dirname(p))}
+    return paths, directories
+
+def config_changes(paths: set):
+    return lambda change, changed_path: changed_path in paths
+
+CONFIG_WAIT_TIMEOUT_MS = 1000  # Re-check interval while waiting for the config file, besides inotify
+config_waiters: dict = {}  # Path -> the single task waiting for that file to appear
+
+async def wait_for_config_file(path: str) -> Mapping[str, Application]:
+    print(f"Waiting for {path} to appear...")
+    while True:
+        paths, directories = config_watch_targets(path)
+        # The first yield is a timeout once the watch is live, so a file written before then is still found
+        async for _ in awatch(*directories, watch_filter=config_changes(paths), recursive=False,
+                              rust_timeout=CONFIG_WAIT_TIMEOUT_MS, yield_on_timeout=True):
+            applications = load_applications(path)
+            if applications is not None:
+                return applications
+            if config_watch_targets(path)[0] != paths:
+                break  # The symlink now points somewhere else
+
+async def wait_for_applications(path: Optional[str] = None) -> Mapping[str, Application]:
+    """Wait without blocking the event loop until the config file exists and parses"""
+    path = path or PORTAL_CONFIG_PATH
+    applications = load_applications(path)
+    if applications is not None:
+        return applications
+
+    # Every caller shares one watch rather than starting its own
+    waiter = config_waiters.get(path)
+    if waiter is None or waiter.done():
+        waiter = config_waiters[path] = asyncio.create_task(wait_for_config_file(path))
+    return await asyncio.shield(waiter)
+
+async def watch_applications(path: Optional[str] = None, stop_event: Optional[asyncio.Event] = None):
+    """Re-read the config on every change so subscribers hear about edits as they happen"""
+    path = path or PORTAL_CONFIG_PATH
+    while not (stop_event and stop_event.is_set()):
+        paths, directories = config_watch_targets(path)
+        async for _ in awatch(*directories, watch_filter=config_changes(paths), recursive=False, stop_event=stop_event):
+            try:
+                load_applications(path)
+            except ConfigError as e:
+                print(e)
+            if config_watch_targets(path)[0] != paths:
+                break  # Follow the symlink to its new target
+
+def watch_applications_blocking(path: Optional[str] = None):
+    """watch_applications for synchronous services"""
+    path = path or PORTAL_CONFIG_PATH
+    while True:
+        paths, directories = config_watch_targets(path)
+        for _ in watch(*directories, watch_filter=config_changes(paths), recursive=False):
+            try:
+                load_applications(path)
+            except ConfigError as e:
+                print(e)
+            if config_watch_targets(path)[0] != paths:
+                break
@@ -3,45 +3,84 @@ import re
 import requests
 import asyncio
 import json
-import yaml
+import sys
+import time
+import signal
+from collections import deque
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 from fastapi import FastAPI, HTTPException
 import aiohttp
+from aiohttp import web
 from urllib.parse import urlparse
-from cachetools import TTLCache
+from watchfiles import awatch
 import ipaddress
 
+# portal_config is shared with the portal and caddy_manager from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import portal_config
+
 cloudflare_metrics = os.environ.get("CLOUDFLARE_METRICS", "localhost:11113")
 public_ipaddr = None
+direct_urls_cache: Optional[Dict[str, str]] = None  # Port -> direct URL, rebuilt when the public IP changes
 app = FastAPI()
 
 CLOUDFLARED_BIN = "/opt/portal-aio/tunnel_manager/cloudflared"
 CF_TUNNEL_TOKEN = os.environ.get('CF_TUNNEL_TOKEN')
 cloudflared_account_process: Optional[asyncio.subprocess.Process] = None
 
-def get_scheme():
-    if os.environ.get("ENABLE_HTTPS", "false").lower() != "true":
-        scheme = "http"
-    else:
-        scheme = "https"
-    return scheme
-
-def load_config():
-    yaml_path = '/etc/portal.yaml'
-    if os.path.exists(yaml_path):
-        with open(yaml_path, 'r') as file:
-            config_applications = yaml.safe_load(file)['applications']
-            return hydrate_applications(config_applications)
-        
-def hydrate_applications(applications):
-    for app_name, app in applications.items():
-        if app["external_port"] == app["internal_port"] and app["internal_port"] == 8080:
-            scheme = "https"
-        else:
-            scheme = get_scheme()
-        applications[app_name]["target_url"] = f'{scheme}://{app["hostname"]}:{app["external_port"]}'
-    return applications
+async def start_default_tunnels(applications):
+    """Create a quick tunnel for every configured target that doesn't have one yet"""
+    # Track unique ports and their first app name
+    unique_targets = {}
+    for app_name, application in applications.items():
+        target = application.target_url
+        if target not in unique_targets and target not in quick_tunnels:
+            unique_targets[target] = app_name
+
+    # Create tunnels only for unique ports; one failure must not abort the others
+    targets = list(unique_targets.keys())
+    default_tunnels = await asyncio.gather(
+        *[get_or_create_quick_tunnel(f"{target}") for target in targets],
+        return_exceptions=True
+    )
+
+    # Print results
+    for target, result in zip(targets, default_tunnels):
+        app_name = unique_targets[target]
+        if isinstance(result, Exception):
+            print(f"Failed to create default tunnel for {app_name} ({target}): {str(result)}")
+        elif result:
+            print(f"Default Tunnel started for {app_name} ({target}) - {result.tunnel_url}?token={os.environ.get('OPEN_BUTTON_TOKEN')}")
+
+async def start_configured_tunnels():
+    # The portal config may be written after we start; users can still create tunnels in the UI meanwhile
+    global configured_targets
+    try:
+        applications = await portal_config.wait_for_applications()
+    except portal_config.ConfigError as e:
+        # Nothing is configured yet, so every application in the fixed file counts as newly added
+        print(f"Not starting default tunnels until portal.yaml is fixed: {e}")
+        configured_targets = set()
+        return
+    configured_targets = {application.target_url for application in applications.values()}
+    await start_default_tunnels(applications)
+
+def on_config_change(applications):
+    # Only applications newly added to portal.yaml get a default tunnel; tunnels the user stopped stay stopped
+    global configured_targets
+    if configured_targets is None:
+        return
+    added = {app_name: application for app_name, application in applications.items() if application.target_url not in configured_targets}
+    configured_targets = {application.target_url for application in applications.values()}
+    if added:
+        task = asyncio.get_running_loop().create_task(start_default_tunnels(added))
+        config_change_tasks.add(task)
+        task.add_done_callback(config_change_tasks.discard)
+
+configured_targets: Optional[set] = None  # Targets in portal.yaml as last seen, None until default tunnels have started
+config_change_tasks: set = set()  # Held so the tasks aren't garbage collected mid-run
+portal_config.subscribe(on_config_change)
 
 # Function to fetch the public IP address
 def get_public_ip():
@@ -58,7 +97,9 @@ def set_external_ip(ip: str):
         ip_obj = ipaddress.IPv4Address(ip)
         
         # If valid, set the global ip_address
-        global public_ipaddr
+        global public_ipaddr, direct_urls_cache
+        if public_ipaddr != str(ip_obj):
+            direct_urls_cache = None
         public_ipaddr = str(ip_obj)
         
         # Return status 200 if successful
@@ -69,25 +110,249 @@ def set_external_ip(ip: str):
         raise HTTPException(status_code=500, detail="Invalid IPv4 address")
 
 
+def get_direct_scheme(port: int):
+    if os.environ.get("ENABLE_HTTPS", "false").lower() == "true" or port == 8080:
+        return "https://"
+    return "http://"
+
+def get_direct_urls():
+    """Map every port exposed through VAST_TCP_PORT_* to its public URL"""
+    global direct_urls_cache
+    if direct_urls_cache is None:
+        # The environment is fixed for our lifetime, so only the public IP can invalidate this
+        public_ip = get_public_ip()
+        direct_urls = {}
+        for env_var_name, port_value in os.environ.items():
+            port = env_var_name[len("VAST_TCP_PORT_"):]
+            if env_var_name.startswith("VAST_TCP_PORT_") and port.isdigit():
+                # {PUBLIC_IP}:{PORT_VALUE}
+                direct_urls[port] = f"{get_direct_scheme(int(port))}{public_ip}:{port_value}"
+        direct_urls_cache = direct_urls
+    return direct_urls_cache
+
+@app.get("/get-direct-urls")
+def get_port_mappings():
+    return {"result": get_direct_urls()}
+
 @app.get("/get-direct-url/{port}")
 def get_port_mapping(port: int):
-    # Fetch the public IP
-    public_ip = get_public_ip()
+    direct_url = get_direct_urls().get(str(port))
 
-    if os.environ.get("ENABLE_HTTPS", "false").lower() == "true" or port == 8080:
-        scheme = "https://"
-    else:
-        scheme = "http://"
+    if direct_url is None:
+        raise HTTPException(status_code=404, detail=f"Environment variable VAST_TCP_PORT_{port} not found")
+
+    return {"result": direct_url}
+
+TUNNEL_LOG_RING_SIZE = 200  # Parsed records kept per tunnel for /get-tunnel-logs
+TUNNEL_LOG_BATCH_LINES = 100  # Lines written to stdout in one go
+TUNNEL_LOG_BATCH_WINDOW = 0.2  # Seconds to gather a batch
+TUNNEL_LOG_RATE_WINDOW = 60  # Seconds over which repeated messages are counted
+TUNNEL_LOG_RATE_BURST = 5  # Repeats of one message allowed per window before suppressing
+LOG_LEVELS = {"DBG": 10, "INF": 20, "WRN": 30, "ERR": 40, "FTL": 50}
+
+class TunnelLogPipeline:
+    """Parses cloudflared output into records, rate-limits repeats and writes to stdout in batches"""
+    line_pattern = re.compile(r'^(\S+)\s+(DBG|INF|WRN|ERR|FTL)\s+(.*)$')
+    field_pattern = re.compile(r'\s(\w+)=("[^"]*"|\S+)')
+
+    def __init__(self):
+        self.records: Dict[str, deque] = {}
+        self._pending: list = []
+        self._ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._seen: Dict[tuple, list] = {}  # (tunnel, level, event) -> [window start, count]
+
+    def parse(self, tunnel: str, line: str) -> dict:
+        match = self.line_pattern.match(line)
+        if not match:
+            return {"time": None, "level": "INF", "tunnel": tunnel, "event": line, "fields": {}}
+        timestamp, level, message = match.groups()
+        fields = {key: value.strip('"') for key, value in self.field_pattern.findall(' ' + message)}
+        event = self.field_pattern.sub('', ' ' + message).strip()
+        return {"time": timestamp, "level": level, "tunnel": tunnel, "event": event, "fields": fields}
+
+    def _allow(self, record: dict) -> tuple:
+        """Return (allowed, suppressed count to report) for a record."""
+        now = time.monotonic()
+        # Reconnect messages differ only in counters and delays
+        key = (record["tunnel"], record["level"], re.sub(r'\d+', '#', record["event"]))
+        entry = self._seen.get(key)
+        if entry is None or now - entry[0] >= TUNNEL_LOG_RATE_WINDOW:
+            suppressed = entry[1] - TUNNEL_LOG_RATE_BURST if entry and entry[1] > TUNNEL_LOG_RATE_BURST else 0
+            if len(self._seen) > 1000:
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < TUNNEL_LOG_RATE_WINDOW}
+            self._seen[key] = [now, 1]
+            return True, suppressed
+        entry[1] += 1
+        return entry[1] <= TUNNEL_LOG_RATE_BURST, 0
+
+    def submit(self, tunnel: str, line: str):
+        """Queue one line of cloudflared output; never blocks the reader"""
+        if not line:
+            return
+        record = self.parse(tunnel, line)
+        allowed, suppressed = self._allow(record)
+        if not allowed:
+            return
+        if suppressed:
+            record["suppressed"] = suppressed
+            line += f" ({suppressed} similar messages suppressed)"
+
+        self.records.setdefault(tunnel, deque(maxlen=TUNNEL_LOG_RING_SIZE)).append(record)
+        self._pending.append(f"[{tunnel}] {line}\n")
+        self._ready.set()
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.get_running_loop().create_task(self._write_batches())
+
+    def flush(self):
+        if self._pending:
+            sys.stdout.write(''.join(self._pending))
+            sys.stdout.flush()
+            self._pending.clear()
+
+    async def _write_batches(self):
+        try:
+            while True:
+                await self._ready.wait()
+                if len(self._pending) < TUNNEL_LOG_BATCH_LINES:
+                    await asyncio.sleep(TUNNEL_LOG_BATCH_WINDOW)
+                self._ready.clear()
+                self.flush()
+        except asyncio.CancelledError:
+            self.flush()
+
+    async def close(self):
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self.flush()
+
+    def query(self, tunnel: Optional[str] = None, level: str = "DBG", limit: int = 100) -> Dict[str, list]:
+        min_level = LOG_LEVELS.get(level.upper(), 0)
+        tunnels = [tunnel] if tunnel else list(self.records)
+        result = {}
+        for name in tunnels:
+            matching = [r for r in self.records.get(name, ()) if LOG_LEVELS.get(r["level"], 0) >= min_level]
+            result[name] = matching[-limit:]
+        return result
+
+tunnel_logs = TunnelLogPipeline()
+
+# Opt-in: when set, stopping tunnel_manager leaves quick tunnels public so a restart can adopt them
+PERSIST_QUICK_TUNNELS = os.environ.get("PERSIST_QUICK_TUNNELS", "false").lower() == "true"
+TUNNEL_STATE_DIR = os.environ.get("TUNNEL_STATE_DIR", "/var/lib/portal-aio/tunnel_manager")
+TUNNEL_STATE_FILE = os.path.join(TUNNEL_STATE_DIR, "quick_tunnels.json")
+TUNNEL_LOG_DIR = os.path.join(TUNNEL_STATE_DIR, "logs")  # cloudflared output; a pipe would die with tunnel_manager
+TUNNEL_LOG_MAX_BYTES = 1024 * 1024  # A cloudflared log is emptied once this much of it has been read
+TUNNEL_LOG_WATCH_TIMEOUT_MS = 1000  # Idle wakeup of the log watch; the first one signals that it is live
+
+class TunnelLogWatcher:
+    """A single inotify watch on TUNNEL_LOG_DIR that wakes the reader of whichever log changed"""
+    def __init__(self):
+        self.waiters: Dict[str, asyncio.Event] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def register(self, path: str) -> asyncio.Event:
+        changed = self.waiters[path] = asyncio.Event()
+        if self._task is None or self._task.done():
+            os.makedirs(TUNNEL_LOG_DIR, exist_ok=True)
+            self._task = asyncio.create_task(self._watch())
+        return changed
 
-    # Fetch the environment variable dynamically
-    env_var_name = f"VAST_TCP_PORT_{port}"
-    port_value = os.getenv(env_var_name)
+    def unregister(self, path: str):
+        self.waiters.pop(path, None)
 
-    if port_value is None:
-        raise HTTPException(status_code=404, detail=f"Environment variable {env_var_name} not found")
+    async def _watch(self):
+        ready = False
+        async for changes in awatch(TUNNEL_LOG_DIR, recursive=False, debounce=200, step=20,
+                                    rust_timeout=TUNNEL_LOG_WATCH_TIMEOUT_MS, yield_on_timeout=True):
+            if not ready:
+                # The first yield means the watch is live; readers that registered before then re-read
+                # in case cloudflared wrote in between, such as the line with the tunnel URL
+                ready = True
+                for changed in self.waiters.values():
+                    changed.set()
+            for _, path in changes:
+                changed = self.waiters.get(path)
+                if changed:
+                    changed.set()
 
-    # Return the {PUBLIC_IP}:{PORT_VALUE}
-    return {"result": f"{scheme}{public_ip}:{port_value}"}
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+tunnel_log_watcher = TunnelLogWatcher()
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Zombies have exited; the state field follows the parenthesised command name
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return False
+
+def get_process_cmdline(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            return [arg.decode(errors='replace') for arg in f.read().split(b'\0') if arg]
+    except OSError:
+        return []
+
+class AdoptedProcess:
+    """Stand-in for asyncio.subprocess.Process for a cloudflared started by a previous tunnel_manager"""
+    def __init__(self, pid: int):
+        self.pid = pid
+        # The real exit status goes to whoever reaps the process, so -1 marks "exited"
+        self.returncode: Optional[int] = None
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def send_signal(self, sig):
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def wait(self) -> int:
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            pidfd = os.pidfd_open(self.pid)
+        except (AttributeError, ProcessLookupError):
+            pidfd = None
+        except OSError:
+            pidfd = -1
+
+        if pidfd is None:
+            pass  # Already gone
+        elif pidfd >= 0:
+            # pidfds become readable when the process exits
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+        else:
+            while is_process_alive(self.pid):
+                await asyncio.sleep(1)
+
+        self.returncode = -1
+        return self.returncode
 
 class QuickTunnel:
     def __init__(self, target_url: str):
@@ -97,9 +362,13 @@ class QuickTunnel:
         self.port = self.target.port
         self.process: Optional[asyncio.subprocess.Process] = None
         self.tunnel_url: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.log_path: Optional[str] = None
+        self._lines = None
         self._print_task = None
 
-    def get_parsed_target(self, target_url: str):
+    @staticmethod
+    def get_parsed_target(target_url: str):
         """Parse and normalize target URL."""
         if not target_url.startswith(('http://', 'https://')):
             target_url = 'http://' + target_url
@@ -109,25 +378,30 @@ class QuickTunnel:
     async def start(self, timeout: int = 30):
         """Start the cloudflared process and capture the tunnel URL."""
         try:
-            self.process = await asyncio.create_subprocess_exec(
-                CLOUDFLARED_BIN, '--no-tls-verify', '--url', self.target.geturl(),
-                env = os.environ.copy(),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
+            os.makedirs(TUNNEL_LOG_DIR, exist_ok=True)
+            self.log_path = os.path.join(TUNNEL_LOG_DIR, f"{QuickTunnelRouter.get_slug(self.target)}-{time.time_ns()}.log")
+            # Append mode so the log can be truncated underneath cloudflared
+            with open(self.log_path, 'ab') as log_file:
+                self.process = await asyncio.create_subprocess_exec(
+                    CLOUDFLARED_BIN, '--no-tls-verify', '--url', self.target.geturl(),
+                    env = os.environ.copy(),
+                    stdout=log_file,
+                    stderr=asyncio.subprocess.STDOUT,
+                    # Outside our process group so it can outlive a tunnel_manager restart
+                    start_new_session=PERSIST_QUICK_TUNNELS
+                )
+            self.started_at = time.time()
+            self._lines = self._read_lines(0)
             
             # Create a task for getting the tunnel URL
             async def wait_for_tunnel_url():
                 while True:
-                    if not self.process or self.process.stdout is None:
-                        raise Exception("Process or stdout is None")
-                        
-                    line = await self.process.stdout.readline()
-                    if not line:
+                    try:
+                        line_str = await self._lines.__anext__()
+                    except StopAsyncIteration:
                         raise Exception("Process stopped without providing tunnel URL")
                         
-                    line_str = line.decode().strip()
-                    print(f"[{self.target.geturl()}] {line_str}")
+                    tunnel_logs.submit(self.target.geturl(), line_str)
                     # Avoid error response URLS on the trycloudflare domain
                     match = re.search(r'(https://\w+(-\w+){1,}\.trycloudflare\.com)', line_str)
                     if match:
@@ -150,40 +424,113 @@ class QuickTunnel:
             await self.stop()
             raise Exception(f"Failed to start tunnel: {str(e)}")
 
+    @classmethod
+    def adopt(cls, state: dict) -> Optional["QuickTunnel"]:
+        """Reattach to a tunnel recorded by a previous tunnel_manager, or None if it is gone or the pid was reused."""
+        tunnel = cls(state["target"])
+        pid = state["pid"]
+        cmdline = get_process_cmdline(pid)
+        if not is_process_alive(pid) or not cmdline or not cmdline[0].endswith(os.path.basename(CLOUDFLARED_BIN)) \
+                or tunnel.target.geturl() not in cmdline:
+            return None
+
+        tunnel.process = AdoptedProcess(pid)
+        tunnel.tunnel_url = state["tunnel_url"]
+        tunnel.started_at = state["started_at"]
+        tunnel.log_path = state.get("log_path")
+        if tunnel.log_path and os.path.exists(tunnel.log_path):
+            tunnel._lines = tunnel._read_lines(os.path.getsize(tunnel.log_path))
+            tunnel._print_task = asyncio.create_task(tunnel._print_output())
+        return tunnel
+
+    def to_state(self) -> dict:
+        return {
+            "target": self.target.geturl(),
+            "pid": self.process.pid,
+            "tunnel_url": self.tunnel_url,
+            "started_at": self.started_at,
+            "log_path": self.log_path
+        }
+
+    async def _read_lines(self, offset: int):
+        """Follow the cloudflared log from offset until the process exits."""
+        changed = await tunnel_log_watcher.register(self.log_path)
+
+        async def wait_for_exit():
+            await self.process.wait()
+            changed.set()
+        exit_task = asyncio.create_task(wait_for_exit())
+
+        try:
+            with open(self.log_path, 'rb') as log_file:
+                log_file.seek(offset)
+                partial = b''
+                while True:
+                    changed.clear()
+                    exited = exit_task.done()
+                    while chunk := log_file.readline():
+                        partial += chunk
+                        if partial.endswith(b'\n'):
+                            yield partial.decode(errors='replace').strip()
+                            partial = b''
+                    if exited:
+                        if partial:
+                            yield partial.decode(errors='replace').strip()
+                        return
+                    if not partial and log_file.tell() >= TUNNEL_LOG_MAX_BYTES:
+                        # Everything so far has been passed on; a line written in between is the only loss
+                        os.truncate(self.log_path, 0)
+                        log_file.seek(0)
+                    await changed.wait()
+        finally:
+            exit_task.cancel()
+            tunnel_log_watcher.unregister(self.log_path)
+
     async def _print_output(self):
         """Continuously print the process output."""
-        while True:
-            try:
-                if not self.process or self.process.stdout is None:
-                    break
-                    
-                line = await self.process.stdout.readline()
-                if not line:
-                    break
-                    
-                print(f"[{self.target.geturl()}] {line.decode().strip()}")
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                print(f"Error reading output for {self.target.geturl()}: {e}")
-                break
+        try:
+            async for line in self._lines:
+                tunnel_logs.submit(self.target.geturl(), line)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            print(f"Error reading output for {self.target.geturl()}: {e}")
+            return
+        # The process has exited and can't be adopted, whoever owned it
+        self.remove_log()
 
-    async def stop(self):
-        """Stop the tunnel and printing."""
+    async def detach(self):
+        """Stop following the tunnel but leave cloudflared running for the next tunnel_manager."""
         if self._print_task:
             self._print_task.cancel()
             try:
                 await self._print_task
             except asyncio.CancelledError:
                 pass
+
+    async def stop(self):
+        """Stop the tunnel and printing."""
+        await self.detach()
                 
-        if self.process:
+        if self.process and self.process.returncode is None:
             try:
                 self.process.terminate()
                 await asyncio.wait_for(self.process.wait(), timeout=5)
             except asyncio.TimeoutError:
                 self.process.kill()  # Force kill if it doesn't terminate
                 await self.process.wait()
+            except ProcessLookupError:
+                pass
+
+        self.remove_log()
+
+    def remove_log(self):
+        """Delete the cloudflared log; its lines have already been printed to ours."""
+        if self.log_path:
+            try:
+                os.remove(self.log_path)
+            except OSError:
+                pass
 
     async def __aenter__(self):
         await self.start()
@@ -192,16 +539,448 @@ class QuickTunnel:
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.stop()
 
+QUICK_TUNNEL_MODE = os.environ.get("QUICK_TUNNEL_MODE", "process").lower()  # "process" (one cloudflared per target) or "multiplex"
+QUICK_TUNNEL_ROUTER_PORT = int(os.environ.get("QUICK_TUNNEL_ROUTER_PORT", "11114"))
+ROUTED_PATH_PREFIX = "/_tunnel/"
+ROUTED_COOKIE = "portal_tunnel_target"
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length"
+}
+
+class QuickTunnelRouter:
+    """Local reverse proxy that lets one cloudflared quick tunnel serve many targets.
+
+    Each target is published under /_tunnel/<slug>/ on the shared tunnel hostname.
+    Root-relative requests an application makes without the prefix are routed by
+    their Referer, falling back to the target the browser last opened (cookie).
+    Prewarmed standby tunnels each have their own hostname and are routed by Host.
+    """
+    def __init__(self, port: int):
+        self.port = port
+        self.routes: Dict[str, "RoutedQuickTunnel"] = {}  # Slug -> tunnel
+        self.hosts: Dict[str, "StandbyQuickTunnel"] = {}  # Tunnel hostname -> tunnel
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def get_slug(target) -> str:
+        return re.sub(r'[^a-zA-Z0-9]+', '-', f"{target.hostname}-{target.port}").strip('-').lower()
+
+    async def start(self):
+        if self._runner:
+            return
+        server = web.Application()
+        server.router.add_route('*', '/{path:.*}', self.handle)
+        self._runner = web.AppRunner(server, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port).start()
+        # Targets may use self-signed certs, matching cloudflared --no-tls-verify
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(ssl=False),
+            auto_decompress=False,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=10)
+        )
+        print(f"Quick tunnel router listening on 127.0.0.1:{self.port}")
+
+    async def stop(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def resolve(self, request: web.Request):
+        """Return (tunnel, slug, upstream path) for a request, or (None, None, None) if it matches no target.
+
+        slug is None when the request was routed by hostname and needs no prefix handling.
+        """
+        path = request.rel_url.path
+        hostname = request.host.rsplit(':', 1)[0].lower()
+        if hostname in self.hosts:
+            return self.hosts[hostname], None, path
+
+        if path.startswith(ROUTED_PATH_PREFIX):
+            slug, _, rest = path[len(ROUTED_PATH_PREFIX):].partition('/')
+            if slug in self.routes:
+                return self.routes[slug], slug, '/' + rest
+
+        referer = urlparse(request.headers.get('Referer', '')).path
+        if referer.startswith(ROUTED_PATH_PREFIX):
+            slug = referer[len(ROUTED_PATH_PREFIX):].partition('/')[0]
+            if slug in self.routes:
+                return self.routes[slug], slug, path
+
+        slug = request.cookies.get(ROUTED_COOKIE)
+        if slug in self.routes:
+            return self.routes[slug], slug, path
+        return None, None, None
+
+    def unroute(self, tunnel):
+        """Drop every route still pointing at this tunnel"""
+        for table in (self.routes, self.hosts):
+            for key, owner in list(table.items()):
+                if owner is tunnel:
+                    del table[key]
+
+    async def handle(self, request: web.Request):
+        tunnel, slug, path = self.resolve(request)
+        if tunnel is None:
+            raise web.HTTPNotFound(text="No tunnel target for this path")
+
+        upstream = tunnel.target.geturl().rstrip('/') + path
+        if request.rel_url.query_string:
+            upstream += '?' + request.rel_url.query_string
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        if slug:
+            headers['X-Forwarded-Prefix'] = f"{ROUTED_PATH_PREFIX}{slug}"
+
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await self.proxy_websocket(request, upstream, headers)
+
+        async with self._session.request(
+            request.method, upstream, headers=headers,
+            data=request.content if request.body_exists else None,
+            allow_redirects=False
+        ) as upstream_response:
+            response = web.StreamResponse(status=upstream_response.status, reason=upstream_response.reason)
+            for key, value in upstream_response.headers.items():
+                if key.lower() in HOP_BY_HOP_HEADERS:
+                    continue
+                # Keep root-relative redirects inside this target's prefix
+                if slug and key.lower() == 'location' and value.startswith('/') and not value.startswith('//'):
+                    value = f"{ROUTED_PATH_PREFIX}{slug}{value}"
+                response.headers.add(key, value)
+            if upstream_response.content_length is not None:
+                response.content_length = upstream_response.content_length
+            if slug:
+                response.set_cookie(ROUTED_COOKIE, slug, path='/', httponly=True, samesite='Lax')
+            await response.prepare(request)
+            async for chunk in upstream_response.content.iter_any():
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+
+    async def proxy_websocket(self, request: web.Request, upstream: str, headers: dict):
+        # The handshake headers are generated by both sides
+        headers = {k: v for k, v in headers.items() if not k.lower().startswith('sec-websocket')}
+        protocols = [p.strip() for p in request.headers.get('Sec-WebSocket-Protocol', '').split(',') if p.strip()]
+        async with self._session.ws_connect(upstream, headers=headers, protocols=protocols) as upstream_ws:
+            client_ws = web.WebSocketResponse(protocols=protocols)
+            await client_ws.prepare(request)
+
+            async def relay(source, destination):
+                async for message in source:
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        await destination.send_str(message.data)
+                    elif message.type == aiohttp.WSMsgType.BINARY:
+                        await destination.send_bytes(message.data)
+                    else:
+                        break
+                await destination.close()
+
+            await asyncio.gather(relay(client_ws, upstream_ws), relay(upstream_ws, client_ws), return_exceptions=True)
+            return client_ws
+
+quick_tunnel_router = QuickTunnelRouter(QUICK_TUNNEL_ROUTER_PORT)
+shared_quick_tunnel: Optional[QuickTunnel] = None  # The single cloudflared process in multiplex mode
+shared_quick_tunnel_lock = asyncio.Lock()
+
+class RoutedQuickTunnel:
+    """A target served through the shared quick tunnel; same interface as QuickTunnel"""
+    def __init__(self, target_url: str):
+        self.target = QuickTunnel.get_parsed_target(target_url)
+        self.slug = QuickTunnelRouter.get_slug(self.target)
+        self.tunnel_url: Optional[str] = None
+
+    @property
+    def process(self) -> Optional[asyncio.subprocess.Process]:
+        return shared_quick_tunnel.process if shared_quick_tunnel else None
+
+    async def start(self, timeout: int = 30):
+        global shared_quick_tunnel
+        async with shared_quick_tunnel_lock:
+            if shared_quick_tunnel is None or shared_quick_tunnel.process.returncode is not None:
+                await quick_tunnel_router.start()
+                tunnel = QuickTunnel(f"http://127.0.0.1:{quick_tunnel_router.port}")
+                await tunnel.start(timeout)
+                shared_quick_tunnel = tunnel
+
+        quick_tunnel_router.routes[self.slug] = self
+        self.tunnel_url = f"{shared_quick_tunnel.tunnel_url}{ROUTED_PATH_PREFIX}{self.slug}"
+
+    async def stop(self):
+        """Remove the route, and the shared process once nothing is routed through it."""
+        global shared_quick_tunnel
+        quick_tunnel_router.unroute(self)
+        async with shared_quick_tunnel_lock:
+            if shared_quick_tunnel and not quick_tunnel_router.routes:
+                await shared_quick_tunnel.stop()
+                shared_quick_tunnel = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+QUICK_TUNNEL_STANDBY = int(os.environ.get("QUICK_TUNNEL_STANDBY", "0"))  # Prewarmed tunnels kept ready for new targets and refreshes
+STANDBY_RETRY_INTERVAL = 30  # Seconds before retrying after standby tunnels fail to start
+STANDBY_START_CONCURRENCY = 1  # Standby starts have their own limit so a refill never holds up a requested tunnel
+
+standby_start_semaphore = asyncio.Semaphore(STANDBY_START_CONCURRENCY)
+
+standby_tunnels: list = []  # Started QuickTunnels to the router, not yet assigned to a target
+standby_refill_requested = asyncio.Event()
+
+class StandbyQuickTunnel:
+    """A tunnel to the router with its own hostname, serving one target; same interface as QuickTunnel
+
+    Either a prewarmed standby tunnel that was claimed, or a routed target moved onto its own hostname by a refresh.
+    """
+    def __init__(self, tunnel: QuickTunnel, target_url: str):
+        self.tunnel = tunnel
+        self.target = QuickTunnel.get_parsed_target(target_url)
+        self.tunnel_url = tunnel.tunnel_url
+        self.hostname = urlparse(tunnel.tunnel_url).hostname
+
+    @property
+    def process(self) -> Optional[asyncio.subprocess.Process]:
+        return self.tunnel.process
+
+    async def start(self, timeout: int = 30):
+        quick_tunnel_router.hosts[self.hostname] = self
+
+    async def stop(self):
+        quick_tunnel_router.unroute(self)
+        await self.tunnel.stop()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+def claim_standby_tunnel(target_url: str) -> Optional[StandbyQuickTunnel]:
+    """Assign a live standby tunnel to target_url, or None if the pool is empty"""
+    while standby_tunnels:
+        tunnel = standby_tunnels.pop(0)
+        standby_refill_requested.set()
+        if tunnel.process and tunnel.process.returncode is None:
+            return StandbyQuickTunnel(tunnel, target_url)
+    return None
+
+async def start_standby_tunnel():
+    async with standby_start_semaphore:
+        tunnel = QuickTunnel(f"http://127.0.0.1:{quick_tunnel_router.port}")
+        await tunnel.start()
+    standby_tunnels.append(tunnel)
+
+async def standby_pool_filler():
+    """Keep QUICK_TUNNEL_STANDBY tunnels started so claiming one is instant"""
+    while True:
+        standby_tunnels[:] = [t for t in standby_tunnels if t.process and t.process.returncode is None]
+        missing = QUICK_TUNNEL_STANDBY - len(standby_tunnels)
+        retry = False
+        if missing > 0:
+            await quick_tunnel_router.start()
+            results = await asyncio.gather(*[start_standby_tunnel() for _ in range(missing)], return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Failed to start standby tunnel: {str(result)}")
+                    retry = True
+
+        standby_refill_requested.clear()
+        try:
+            await asyncio.wait_for(standby_refill_requested.wait(), STANDBY_RETRY_INTERVAL if retry else 10)
+        except asyncio.TimeoutError:
+            pass
+
 quick_tunnels: Dict[str, QuickTunnel] = {}
 
-async def monitor_processes():
-    """Ensure tunnels stopped outside of this process are handled"""
+RESTART_BACKOFF_INITIAL = 1  # Seconds before the first restart of a dead cloudflared
+RESTART_BACKOFF_MAX = 60
+CRASH_LOOP_RESTARTS = 5  # Exits within CRASH_LOOP_WINDOW that stop further restarts
+CRASH_LOOP_WINDOW = 300
+
+class TunnelHealth:
+    """Restart history of one supervised cloudflared process"""
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.restarts = 0
+        self.last_exit_code: Optional[int] = None
+        self.crashes = deque(maxlen=CRASH_LOOP_RESTARTS)
+        self.status = "running"
+
+    def record_start(self, started_at: Optional[float] = None):
+        self.started_at = started_at or time.time()
+        self.status = "running"
+
+    def record_exit(self, returncode: Optional[int]) -> float:
+        """Record an unexpected exit and return the delay before restarting, or -1 in a crash loop"""
+        now = time.time()
+        self.last_exit_code = returncode
+        self.started_at = None
+        self.crashes.append(now)
+        if len(self.crashes) == CRASH_LOOP_RESTARTS and now - self.crashes[0] < CRASH_LOOP_WINDOW:
+            self.status = "crash-loop"
+            return -1
+        self.status = "restarting"
+        recent = sum(1 for crashed_at in self.crashes if now - crashed_at < CRASH_LOOP_WINDOW)
+        return min(RESTART_BACKOFF_INITIAL * 2 ** (recent - 1), RESTART_BACKOFF_MAX)
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "restarts": self.restarts,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else None,
+            "last_exit_code": self.last_exit_code
+        }
+
+tunnel_health: Dict[str, TunnelHealth] = {}  # Target -> quick tunnel supervision state
+named_tunnel_health = TunnelHealth()
+quick_tunnel_supervisors: Dict[str, asyncio.Task] = {}
+
+def track_quick_tunnel(target_url: str, tunnel):
+    """Publish a started tunnel and supervise its process"""
+    quick_tunnels[target_url] = tunnel
+    tunnel_health.setdefault(target_url, TunnelHealth()).record_start(getattr(tunnel, 'started_at', None))
+    previous = quick_tunnel_supervisors.get(target_url)
+    if previous and previous is not asyncio.current_task():
+        previous.cancel()
+    quick_tunnel_supervisors[target_url] = asyncio.create_task(supervise_quick_tunnel(target_url, tunnel))
+    save_quick_tunnel_state()
+
+def untrack_quick_tunnel(target_url: str):
+    """Unpublish a tunnel that is being stopped on purpose so it isn't restarted"""
+    tunnel = quick_tunnels.pop(target_url, None)
+    supervisor = quick_tunnel_supervisors.pop(target_url, None)
+    if supervisor and supervisor is not asyncio.current_task():
+        supervisor.cancel()
+    tunnel_health.pop(target_url, None)
+    save_quick_tunnel_state()
+    return tunnel
+
+def save_quick_tunnel_state():
+    """Record the standalone quick tunnels so a restarted tunnel_manager can adopt them"""
+    if not PERSIST_QUICK_TUNNELS:
+        return
+    # Routed and standby tunnels depend on this process's router, so only plain tunnels survive a restart
+    state = [
+        tunnel.to_state() for tunnel in quick_tunnels.values()
+        if type(tunnel) is QuickTunnel and tunnel.process and tunnel.process.returncode is None
+    ]
+    try:
+        os.makedirs(TUNNEL_STATE_DIR, exist_ok=True)
+        temp_path = f"{TUNNEL_STATE_FILE}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, TUNNEL_STATE_FILE)
+    except OSError as e:
+        print(f"Failed to save quick tunnel state: {e}")
+
+def remove_unadopted_logs():
+    """Delete cloudflared logs left by a previous tunnel_manager that no adopted tunnel is writing"""
+    adopted = {tunnel.log_path for tunnel in quick_tunnels.values() if isinstance(tunnel, QuickTunnel)}
+    try:
+        log_names = os.listdir(TUNNEL_LOG_DIR)
+    except OSError:
+        return
+    for log_name in log_names:
+        log_path = os.path.join(TUNNEL_LOG_DIR, log_name)
+        if log_path not in adopted:
+            try:
+                os.remove(log_path)
+            except OSError:
+                pass
+
+def adopt_quick_tunnels():
+    """Take over quick tunnels left running by a previous tunnel_manager"""
+    if not PERSIST_QUICK_TUNNELS or not os.path.exists(TUNNEL_STATE_FILE):
+        remove_unadopted_logs()
+        return
+    try:
+        with open(TUNNEL_STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable quick tunnel state: {e}")
+        state = []
+
+    for entry in state:
+        try:
+            tunnel = QuickTunnel.adopt(entry)
+        except (KeyError, TypeError):
+            tunnel = None
+        if tunnel is None:
+            print(f"Previous tunnel for {entry.get('target')} is no longer running")
+            continue
+        track_quick_tunnel(entry["target"], tunnel)
+        print(f"Adopted tunnel for {entry['target']} - {tunnel.tunnel_url}")
+    save_quick_tunnel_state()
+    remove_unadopted_logs()
+
+async def supervise_quick_tunnel(target_url: str, tunnel):
+    """Wait for the tunnel's process to exit and replace it, backing off on repeated crashes"""
+    if tunnel.process is None:
+        return
+    await tunnel.process.wait()
+    if quick_tunnels.get(target_url) is not tunnel:
+        return
+
+    # Stop advertising the dead URL straight away
+    del quick_tunnels[target_url]
+    quick_tunnel_router.unroute(tunnel)
+    save_quick_tunnel_state()
+    if isinstance(tunnel, QuickTunnel):
+        tunnel.remove_log()
+    health = tunnel_health.setdefault(target_url, TunnelHealth())
+    print(f"Process for {target_url} exited with code {tunnel.process.returncode}")
+
     while True:
-        for key, tunnel in list(quick_tunnels.items()):
-            if tunnel.process.returncode is not None:
-                print(f"Process for {key} has died. Removing from dictionary.")
-                del quick_tunnels[key]
-        await asyncio.sleep(10)  # Check every 10 seconds
+        delay = health.record_exit(tunnel.process.returncode if tunnel.process else None)
+        if delay < 0:
+            quick_tunnel_errors[target_url] = f"cloudflared crashed {CRASH_LOOP_RESTARTS} times in {CRASH_LOOP_WINDOW}s, not restarting"
+            print(f"Tunnel for {target_url} is crash looping, giving up")
+            return
+        await asyncio.sleep(delay)
+        if target_url in quick_tunnels or target_url in pending_quick_tunnels:
+            # Recreated through the API in the meantime
+            return
+        try:
+            tunnel = await create_quick_tunnel(target_url)
+        except Exception as e:
+            quick_tunnel_errors[target_url] = str(e)
+            print(f"Failed to restart tunnel for {target_url}: {str(e)}")
+            continue
+        health.restarts += 1
+        quick_tunnel_errors.pop(target_url, None)
+        print(f"Tunnel for {target_url} restarted - {tunnel.tunnel_url}")
+        track_quick_tunnel(target_url, tunnel)
+        return
+
+async def supervise_cloudflare_daemon(daemon: "CloudflareDaemon"):
+    """Restart the named tunnel daemon whenever it exits unexpectedly"""
+    while True:
+        if daemon.process and daemon.process.returncode is None:
+            named_tunnel_health.record_start()
+            await daemon.process.wait()
+        if daemon.stopped:
+            return
+
+        delay = named_tunnel_health.record_exit(daemon.process.returncode if daemon.process else None)
+        if delay < 0:
+            print("Named tunnel process is crash looping, giving up")
+            return
+        print(f"Named tunnel process exited, restarting in {delay}s")
+        await asyncio.sleep(delay)
+        try:
+            await daemon.start()
+            named_tunnel_health.restarts += 1
+        except Exception as e:
+            print(f"Failed to restart named tunnel process: {str(e)}")
 
 class CloudflareDaemon:
     def __init__(self, token: str):
@@ -209,9 +988,11 @@ class CloudflareDaemon:
         self.metrics = f"{cloudflare_metrics}"
         self.process: Optional[asyncio.subprocess.Process] = None
         self._print_task = None
+        self.stopped = False  # Set once stop() is called so the supervisor leaves it down
 
     async def start(self, timeout: int = 30):
         """Start the cloudflared process and wait for startup confirmation."""
+        self.stopped = False
         try:
             async def start_process():
                 self.process = await asyncio.create_subprocess_exec(
@@ -237,9 +1018,14 @@ class CloudflareDaemon:
                 raise TimeoutError(f"Daemon didn't start within {timeout} seconds")
 
             self._print_task = asyncio.create_task(self._print_output())
+
+            # Ingress rules may differ from the previous run
+            request_named_tunnel_refresh()
             
         except Exception as e:
             await self.stop()
+            # A failed start is not a deliberate stop; leave it to the supervisor
+            self.stopped = False
             raise Exception(f"Failed to start cloudflared daemon: {str(e)}")
 
     async def _print_output(self):
@@ -251,7 +1037,7 @@ class CloudflareDaemon:
                 line = await self.process.stdout.readline()
                 if not line:
                     break
-                print(f"[cloudflared] {line.decode().strip()}")
+                tunnel_logs.submit("cloudflared", line.decode().strip())
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -260,19 +1046,23 @@ class CloudflareDaemon:
 
     async def stop(self):
         """Stop the tunnel and printing."""
+        self.stopped = True
         if self._print_task:
             self._print_task.cancel()
             try:
                 await self._print_task
             except asyncio.CancelledError:
                 pass
-        if self.process:
+        # A crashed daemon has already exited and can't be signalled
+        if self.process and self.process.returncode is None:
             try:
                 self.process.terminate()
                 await asyncio.wait_for(self.process.wait(), timeout=5)
             except asyncio.TimeoutError:
                 self.process.kill()  # Force kill if it doesn't terminate
                 await self.process.wait()
+            except ProcessLookupError:
+                pass
 
     async def __aenter__(self):
         await self.start()
@@ -282,19 +1072,69 @@ class CloudflareDaemon:
         await self.stop()
 
 
+MAX_CONCURRENT_TUNNEL_STARTS = int(os.environ.get("TUNNEL_START_CONCURRENCY", "4"))  # cloudflared processes allowed to start at once
+
+tunnel_start_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TUNNEL_STARTS)
+pending_quick_tunnels: Dict[str, asyncio.Task] = {}  # Target -> in-flight creation shared by concurrent callers
+quick_tunnel_errors: Dict[str, str] = {}  # Target -> error from its most recent failed start
+
 async def create_quick_tunnel(target_url: str) -> QuickTunnel:
-    tunnel = QuickTunnel(target_url)
-    await tunnel.start()
-    return tunnel
+    standby = claim_standby_tunnel(target_url)
+    if standby:
+        await standby.start()
+        return standby
+
+    async with tunnel_start_semaphore:
+        if QUICK_TUNNEL_MODE == "multiplex":
+            tunnel = RoutedQuickTunnel(target_url)
+        else:
+            tunnel = QuickTunnel(target_url)
+        await tunnel.start()
+        return tunnel
 
+async def create_refreshed_quick_tunnel(target_url: str):
+    """Create a tunnel for target_url whose URL differs from the one it has now"""
+    if QUICK_TUNNEL_MODE != "multiplex":
+        return await create_quick_tunnel(target_url)
+
+    # Routed targets all share one hostname, so a refresh moves the target onto a hostname of its own
+    standby = claim_standby_tunnel(target_url)
+    if standby is None:
+        async with tunnel_start_semaphore:
+            await quick_tunnel_router.start()
+            tunnel = QuickTunnel(f"http://127.0.0.1:{quick_tunnel_router.port}")
+            await tunnel.start()
+        standby = StandbyQuickTunnel(tunnel, target_url)
+    await standby.start()
+    return standby
+
+async def register_quick_tunnel(target_url: str) -> QuickTunnel:
+    """Create a tunnel and record the outcome, whether or not the requester is still waiting"""
+    try:
+        tunnel = await create_quick_tunnel(target_url)
+        # An explicit request starts with a clean crash history
+        tunnel_health.pop(target_url, None)
+        track_quick_tunnel(target_url, tunnel)
+        quick_tunnel_errors.pop(target_url, None)
+        return tunnel
+    except Exception as e:
+        quick_tunnel_errors[target_url] = str(e)
+        raise
+    finally:
+        pending_quick_tunnels.pop(target_url, None)
 
 async def get_or_create_quick_tunnel(target_url: str) -> QuickTunnel:
     if target_url in quick_tunnels:
         return quick_tunnels[target_url]
     
-    tunnel = await create_quick_tunnel(target_url)
-    quick_tunnels[target_url] = tunnel
-    return tunnel
+    # Concurrent requests for the same target share one cloudflared launch
+    task = pending_quick_tunnels.get(target_url)
+    if task is None:
+        task = asyncio.create_task(register_quick_tunnel(target_url))
+        pending_quick_tunnels[target_url] = task
+
+    # Shielded so a disconnecting client doesn't abort the launch for everyone else
+    return await asyncio.shield(task)
 
 async def get_existing_quick_tunnel(target_url: str) -> QuickTunnel:
     if target_url in quick_tunnels:
@@ -302,77 +1142,110 @@ async def get_existing_quick_tunnel(target_url: str) -> QuickTunnel:
     else:
         return None
 
-async def get_named_tunnel_url(port: int) -> str:
+NAMED_TUNNEL_REFRESH_INTERVAL = 30  # Seconds between cloudflared ingress config refreshes
+NAMED_TUNNEL_RETRY_INTERVAL = 5  # Faster refresh while the config is unavailable or empty
+
+named_tunnel_index: Optional[Dict[int, str]] = None  # Port -> named tunnel URL, None until first fetch
+named_tunnel_list: list = []  # Every named tunnel as returned by /get-named-tunnels
+named_tunnel_error: Optional[HTTPException] = None  # Error from the most recent refresh
+named_tunnel_refresh_requested = asyncio.Event()  # Set to refresh immediately, e.g. after the daemon restarts
+
+async def fetch_named_tunnel_ingress(session: aiohttp.ClientSession) -> list:
     config_url = f"http://{cloudflare_metrics}/config"
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config_url, timeout=10) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=404, detail="Tunnel config not found")
-                
-                content = await response.text()
-                
-                try:
-                    metrics = json.loads(content)
-                except json.JSONDecodeError as e:
-                    raise Exception("Failed to parse config as JSON")
 
-        ingress = metrics.get('config', {}).get('ingress', [])
-        
-        for entry in ingress:
-            service = entry.get('service', '')
-            if isinstance(service, str) and service.startswith("http") and service.endswith(f":{port}"):
-                hostname = entry.get('hostname')
-                if hostname:
-                    return f"https://{hostname}"
-                
-        raise HTTPException(status_code=404, detail="Named tunnel not found")
-    
+    async with session.get(config_url, timeout=10) as response:
+        if response.status != 200:
+            raise HTTPException(status_code=404, detail="Tunnel config not found")
+
+        content = await response.text()
+
+        try:
+            metrics = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise Exception("Failed to parse config as JSON")
+
+    return metrics.get('config', {}).get('ingress', [])
+
+def build_named_tunnel_index(ingress: list):
+    """Index ingress rules by local port so lookups are a dictionary hit"""
+    index = {}
+    tunnels = []
+
+    for entry in ingress:
+        service = entry.get('service', '')
+        hostname = entry.get('hostname')
+        if not (isinstance(service, str) and service.startswith("http") and hostname):
+            continue
+
+        tunnels.append({
+            "targetUrl": service,
+            "tunnelUrl": f"https://{hostname}"
+        })
+
+        # First matching rule wins, as with the previous linear scan
+        port = urlparse(service).port
+        if port is not None and port not in index:
+            index[port] = f"https://{hostname}"
+
+    return index, tunnels
+
+async def refresh_named_tunnels(session: Optional[aiohttp.ClientSession] = None):
+    global named_tunnel_index, named_tunnel_list, named_tunnel_error
+
+    try:
+        if session is None:
+            async with aiohttp.ClientSession() as new_session:
+                ingress = await fetch_named_tunnel_ingress(new_session)
+        else:
+            ingress = await fetch_named_tunnel_ingress(session)
+        named_tunnel_index, named_tunnel_list = build_named_tunnel_index(ingress)
+        named_tunnel_error = None
     except HTTPException as e:
-        # Re-raise the HTTPException without modifying it
-        raise e
-    except asyncio.TimeoutError:
-        raise Exception("Timeout while connecting to cloudflared metrics endpoint")
-    except aiohttp.ClientError as e:
-        raise Exception(f"Connection error: {str(e)}")
+        named_tunnel_error = e
+    except (aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
+        named_tunnel_error = HTTPException(status_code=404, detail=str(e) or "Timeout while connecting to cloudflared metrics endpoint")
     except Exception as e:
-        raise
+        named_tunnel_error = HTTPException(status_code=500, detail=str(e))
+
+def request_named_tunnel_refresh():
+    named_tunnel_refresh_requested.set()
+
+async def named_tunnel_refresher():
+    """Keep the named tunnel index current so requests never hit cloudflared"""
+    async with aiohttp.ClientSession() as session:
+        while True:
+            named_tunnel_refresh_requested.clear()
+            await refresh_named_tunnels(session)
+
+            interval = NAMED_TUNNEL_RETRY_INTERVAL if named_tunnel_error or not named_tunnel_index else NAMED_TUNNEL_REFRESH_INTERVAL
+            try:
+                await asyncio.wait_for(named_tunnel_refresh_requested.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+async def get_named_tunnel_index() -> Dict[int, str]:
+    # Only reached before the refresher has completed its first pass
+    if named_tunnel_index is None:
+        await refresh_named_tunnels()
+    if named_tunnel_index is None:
+        raise named_tunnel_error
+    return named_tunnel_index
+
+async def get_named_tunnel_url(port: int) -> str:
+    index = await get_named_tunnel_index()
+
+    if port not in index:
+        raise HTTPException(status_code=404, detail="Named tunnel not found")
+
+    return index[port]
 
 @app.get("/get-named-tunnels")
 async def get_named_tunnels():
-    config_url = f"http://{cloudflare_metrics}/config"
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(config_url, timeout=10) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=404, detail="Tunnel config not found")
-                
-                content = await response.text()
-                metrics = json.loads(content)
+    if not CF_TUNNEL_TOKEN:
+        raise HTTPException(status_code=404, detail="CF_TUNNEL_TOKEN is not set")
 
-        ingress = metrics.get('config', {}).get('ingress', [])
-        named_tunnels = []
-        
-        for entry in ingress:
-            service = entry.get('service', '')
-            hostname = entry.get('hostname')
-            if isinstance(service, str) and service.startswith("http") and hostname:
-                named_tunnels.append({
-                    "targetUrl": service,
-                    "tunnelUrl": f"https://{hostname}"
-                })
-                
-        return named_tunnels
-
-    except HTTPException as e:
-        # Re-raise the HTTPException without modifying it
-        raise e
-    except aiohttp.ClientConnectorError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    await get_named_tunnel_index()
+    return named_tunnel_list
 
 @app.get("/get-quick-tunnel/{target_url:path}")
 async def get_quick_tunnel(target_url: str):
@@ -407,24 +1280,73 @@ async def get_all_quick_tunnels():
             })
     return active_tunnels
 
+@app.get("/get-quick-tunnel-status")
+async def get_quick_tunnel_status():
+    """Per-target state of quick tunnels, including failed starts"""
+    status = {}
+    for target_url, error in quick_tunnel_errors.items():
+        status[target_url] = {"status": "failed", "error": error}
+    for target_url in pending_quick_tunnels:
+        status[target_url] = {"status": "starting"}
+    for target_url, tunnel in quick_tunnels.items():
+        status[target_url] = {"status": "active", "tunnel_url": tunnel.tunnel_url}
+    return status
+
+@app.get("/get-tunnel-health")
+async def get_tunnel_health():
+    """Restart counts and uptime of every supervised cloudflared process"""
+    return {
+        "quick_tunnels": {target_url: health.to_dict() for target_url, health in tunnel_health.items()},
+        "named_tunnel": named_tunnel_health.to_dict() if CF_TUNNEL_TOKEN else None
+    }
+
+@app.get("/get-tunnel-logs")
+async def get_tunnel_logs(tunnel: Optional[str] = None, level: str = "DBG", limit: int = 100):
+    """Recent parsed cloudflared records per tunnel ("cloudflared" is the named tunnel daemon)"""
+    return tunnel_logs.query(tunnel, level, max(1, min(limit, TUNNEL_LOG_RING_SIZE)))
+
 @app.post("/stop-quick-tunnel/{target_url:path}")
 async def stop_quick_tunnel(target_url: str):
     if target_url not in quick_tunnels:
         raise HTTPException(status_code=404, detail="Quick tunnel not found")
     
-    tunnel = quick_tunnels[target_url]
+    tunnel = untrack_quick_tunnel(target_url)
     await tunnel.stop()
-
-    del quick_tunnels[target_url]
     return {"message": "Quick tunnel stopped successfully"}
 
 @app.post("/refresh-quick-tunnel/{target_url:path}")
 async def refresh_quick_tunnel(target_url: str):
-    if target_url in quick_tunnels:
-        await stop_quick_tunnel(target_url)
-    tunnel = await get_or_create_quick_tunnel(target_url)
+    old_tunnel = quick_tunnels.get(target_url)
+    if old_tunnel is None:
+        tunnel = await get_or_create_quick_tunnel(target_url)
+        return {"tunnel_url": tunnel.tunnel_url}
+
+    # Make before break: the old tunnel keeps serving until its replacement is up
+    try:
+        tunnel = await create_refreshed_quick_tunnel(target_url)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    track_quick_tunnel(target_url, tunnel)
+    await old_tunnel.stop()
     return {"tunnel_url": tunnel.tunnel_url}
 
+@app.get("/dashboard-state")
+async def get_dashboard_state():
+    """Direct URLs and tunnels for the portal dashboard in a single response"""
+    named_tunnels = []
+    if CF_TUNNEL_TOKEN:
+        try:
+            named_tunnels = await get_named_tunnels()
+        except HTTPException:
+            # Named tunnels are optional; the rest of the state is still useful
+            pass
+
+    return {
+        "direct_urls": get_direct_urls(),
+        "named_tunnels": named_tunnels,
+        "quick_tunnels": await get_all_quick_tunnels()
+    }
+
 @app.get("/get-named-tunnel/{port:int}")
 async def get_named_tunnel(port: int):
     if not CF_TUNNEL_TOKEN:
@@ -442,9 +1364,6 @@ async def get_named_tunnel(port: int):
 @app.on_event("startup")
 async def startup_event():
     try:
-        # Monitor quick tunnels in case user kills them
-        monitor_task = asyncio.create_task(monitor_processes())
-
         # Create the main cloudflared process to handle named tunnels
         global cloudflared_account_process
         if CF_TUNNEL_TOKEN:
@@ -454,51 +1373,59 @@ async def startup_event():
                 print("Named tunnel process started")
             except Exception as e:
                 print(f"Failed to start named tunnel process: {str(e)}")
-        
-        try:
-            # Track unique ports and their first app name
-            config = load_config()
-            unique_targets = {}
-            for app_name, app_config in config.items():
-                target = app_config['target_url']
-                if target not in unique_targets:
-                    unique_targets[target] = app_name
-
-            # Create tunnels only for unique ports
-            tunnel_tasks = []
-            for target in unique_targets.keys():
-                try:
-                    task = get_or_create_quick_tunnel(f"{target}")
-                    tunnel_tasks.append(task)
-                except Exception as e:
-                    print(f"Failed to create tunnel task for {target}: {e}")
-
-            if tunnel_tasks:
-                default_tunnels = await asyncio.gather(*tunnel_tasks)
-
-            # Print results
-            for port, result in zip(unique_targets.keys(), default_tunnels):
-                app_name = unique_targets[target]
-                if isinstance(result, Exception):
-                    print(f"Failed to create default tunnel for {port}: {str(result)}")
-                elif result:
-                    print(f"Default Tunnel started for {port} - {result.tunnel_url}?token={os.environ.get('OPEN_BUTTON_TOKEN')}")
-        except:
-            # User can still create tunnels in the UI
-            pass
+            # Restarts the daemon if it dies, including after a failed first start
+            app.state.named_supervisor_task = asyncio.create_task(supervise_cloudflare_daemon(cloudflared_account_process))
+
+            app.state.named_tunnel_task = asyncio.create_task(named_tunnel_refresher())
+
+        if QUICK_TUNNEL_STANDBY > 0:
+            app.state.standby_pool_task = asyncio.create_task(standby_pool_filler())
+
+        # Tunnels from before a restart keep their URLs, so the defaults below are usually already up
+        adopt_quick_tunnels()
+
+        app.state.default_tunnels_task = asyncio.create_task(start_configured_tunnels())
+        app.state.config_task = asyncio.create_task(portal_config.watch_applications())
     except Exception as e:
         print(f"Startup failed: {str(e)}")
         raise
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    for tunnel in quick_tunnels.values():
-        await tunnel.stop()
+    for task_name in ('default_tunnels_task', 'config_task'):
+        if hasattr(app.state, task_name):
+            getattr(app.state, task_name).cancel()
+    for task in list(config_change_tasks):
+        task.cancel()
+
+    if hasattr(app.state, 'named_tunnel_task'):
+        app.state.named_tunnel_task.cancel()
+
+    if hasattr(app.state, 'standby_pool_task'):
+        app.state.standby_pool_task.cancel()
+    if hasattr(app.state, 'named_supervisor_task'):
+        app.state.named_supervisor_task.cancel()
+    for supervisor in quick_tunnel_supervisors.values():
+        supervisor.cancel()
+
+    save_quick_tunnel_state()
+    stopped = []
+    for tunnel in list(quick_tunnels.values()) + standby_tunnels:
+        if PERSIST_QUICK_TUNNELS and type(tunnel) is QuickTunnel and tunnel in quick_tunnels.values():
+            # Left running for the next tunnel_manager to adopt
+            await tunnel.detach()
+        else:
+            await tunnel.stop()
+            stopped.append(tunnel)
 
     if cloudflared_account_process:
         await cloudflared_account_process.stop()
         print("Full tunnel process terminated")
 
-    await asyncio.gather(*[tunnel.process.wait() for tunnel in quick_tunnels.values() if tunnel.process])
-    if cloudflared_account_process:
-        await cloudflared_account_process.wait()
\ No newline at end of file
+    await quick_tunnel_router.stop()
+    await tunnel_log_watcher.stop()
+
+    await asyncio.gather(*[tunnel.process.wait() for tunnel in stopped if tunnel.process])
+    if cloudflared_account_process and cloudflared_account_process.process:
+        await cloudflared_account_process.process.wait()
+    await tunnel_logs.close()
\ No newline at end of file